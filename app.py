@@ -1,16 +1,32 @@
 # Importações
 import pandas as pd
 import os
+import sys
+import argparse
+import atexit
+import hashlib
+import inspect
+import io
+import json
 from pathlib import Path
 import re
+import shutil
 import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, redirect_stdout
 from datetime import datetime
+from functools import lru_cache, wraps
+from itertools import islice
 import numpy as np
-from sklearn.linear_model import LinearRegression
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MaxNLocator
-import matplotlib.dates as mdates
-from dateutil import parser
+
+# matplotlib, scikit-learn, dateutil e pyarrow só são importados quando usados (ver carregar_graficos,
+# carregar_pyarrow, ajustar_previsao e traduzir_data): o menu abre rápido e as rodadas sem gráfico não pagam por eles
 
 # Variáveis responsáveis pelo acesso às pastas
 PASTA_ENTRADA = 'Entrada'
@@ -19,6 +35,263 @@ PASTA_ESTOQUE = os.path.join(PASTA_ENTRADA, 'Estoque')
 PASTA_VENDAS = os.path.join(PASTA_ENTRADA,'Vendas')
 BANCO_DE_DADOS = 'geral.db'
 
+# Ajustes do SQLite para as gravações em massa (cache_size negativo é em KiB, ~64 MB)
+PRAGMAS_ESCRITA = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+    'mmap_size': 256 * 1024 * 1024,  # bytes lidos direto do arquivo mapeado, sem cópia para o cache do SQLite
+}
+# Nas conexões só de leitura valem os mesmos ajustes, menos os que mudam o arquivo (journal_mode, synchronous)
+PRAGMAS_LEITURA = {pragma: PRAGMAS_ESCRITA[pragma] for pragma in ('cache_size', 'temp_store', 'mmap_size')}
+
+# Conexões da sessão, por (processo, thread, banco, somente_leitura): abertas uma vez e reaproveitadas, com até
+# COMANDOS_PREPARADOS consultas já preparadas em cada uma. REUSAR_CONEXOES=False volta a abrir uma por chamada
+COMANDOS_PREPARADOS = 256
+REUSAR_CONEXOES = True
+CONEXOES = {}
+# Quantidade de linhas gravadas por transação
+TAMANHO_LOTE = 50000
+
+# Quantidade de processos usados para ler os arquivos de entrada (1 = sem paralelismo)
+PROCESSOS_LEITURA = os.cpu_count() or 1
+
+# Linhas lidas por vez de cada CSV de estoque (a memória usada na leitura depende disso, não do tamanho do arquivo)
+TAMANHO_BLOCO_ESTOQUE = 100000
+
+# Guarda cada carga do estoque em 'estoque_historico' (uma partição por data), além de trocar o 'estoque' atual
+MANTER_HISTORICO_ESTOQUE = True
+
+# Dias previstos para o futuro quando nenhum horizonte é informado
+HORIZONTE_PADRAO = 360
+
+# Com False as previsões gravam só os coeficientes de cada par em 'coeficientes_previsao' (poucos bytes por par)
+# e os valores diários são calculados na leitura; com True as linhas diárias também vão para 'previsão_futura'
+MATERIALIZAR_PREVISOES = True
+COLUNAS_PREVISAO = ['sku', 'data', 'quantidade_prevista', 'conta']
+COLUNAS_COEFICIENTES = ['sku', 'conta', 'intercepto', 'coef_t', 'coef_t2', 'data_origem', 'ultima_data']
+
+# Quantidade de pares (sku, conta) que cada processo ajusta por vez na previsão SKU por SKU
+PARES_POR_TAREFA = 200
+
+# Prazo (em dias) entre fazer o pedido e o produto chegar, usado no ponto de pedido
+PRAZO_REPOSICAO_DIAS = 15
+
+# Dias de venda que o pedido sugerido deve cobrir depois que a reposição chega
+DIAS_COBERTURA = 30
+
+# Cache (Arrow IPC) das planilhas de vendas já normalizadas, guardado ao lado do banco
+PASTA_CACHE_VENDAS = os.path.join(os.path.dirname(BANCO_DE_DADOS), 'cache_vendas')
+TAMANHO_MAXIMO_CACHE = 512 * 1024 * 1024  # bytes
+
+# Resultado da leitura de um arquivo de vendas que deu erro (diferente de None, arquivo sem vendas): o arquivo não
+# entra no manifesto e é lido de novo na próxima carga
+FalhaLeitura = namedtuple('FalhaLeitura', ['caminho', 'erro'])
+
+# Meses em português e o equivalente em inglês (usado para ler as datas das planilhas)
+MESES_PT_EN = {
+    'janeiro': 'january', 'fevereiro': 'february', 'março': 'march', 'abril': 'april',
+    'maio': 'may', 'junho': 'june', 'julho': 'july', 'agosto': 'august',
+    'setembro': 'september', 'outubro': 'october', 'novembro': 'november', 'dezembro': 'december'
+}
+# Formatos fixos tentados antes do parser "fuzzy" (já com o mês traduzido para inglês)
+FORMATOS_DATA = ['%d de %B de %Y %H:%M hs.', '%d de %B de %Y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']
+# Quantidade de textos de data guardados no cache do parser "fuzzy"
+TAMANHO_CACHE_DATAS = 100000
+
+# Previsões de comparacao_previsao_vendas já feitas, uma por (sku, conta): as mais recentes ficam em memória
+# (LRU) e todas na tabela 'cache_previsoes'. Valem enquanto o histórico do SKU não mudar, para qualquer horizonte
+# até o guardado, e são apagadas quando os coeficientes do SKU são regravados
+TAMANHO_CACHE_PREVISOES = 256
+CACHE_PREVISOES = OrderedDict()
+
+# Catálogo de SKUs do menu (opções 5 e 6): os SKUs distintos de cada tabela de TABELAS_CATALOGO e a lista
+# ordenada de todos (busca por prefixo). Carregado uma vez por sessão e descartado depois de cada carga
+TABELAS_CATALOGO = ('vendas', 'estoque', 'previsão_futura', 'coeficientes_previsao')
+CONSULTA_SKUS_CATALOGO = 'SELECT DISTINCT sku FROM "{}" WHERE sku IS NOT NULL'
+SUGESTOES_SKU = 10
+CATALOGO_SKUS = {}
+
+# Índices de cada tabela: as buscas filtram por sku (e conta) e ordenam por data.
+# Os de 'vendas' e 'previsão_futura' incluem a quantidade para a consulta ser respondida só pelo índice
+INDICES = {
+    'vendas': {
+        'idx_vendas_sku_contas_data': '(sku, contas, data, quantidade)',
+        'idx_vendas_data': '(data)',
+    },
+    'estoque': {
+        'idx_estoque_sku_data': '(sku, data)',
+    },
+    'estoque_historico': {
+        'idx_estoque_historico_data': '(data)',
+    },
+    'previsão_futura': {
+        'idx_previsao_sku_conta_data': '(sku, conta, data, quantidade_prevista)',
+    },
+    'vendas_por_arquivo': {
+        'idx_vendas_por_arquivo_caminho': '(caminho)',
+        'idx_vendas_por_arquivo_chave': '(contas, sku, data)',
+    },
+}
+
+# Primeiro e último dia de 'vendas': cada lado é uma busca no índice por data, sem ler a tabela
+CONSULTA_INTERVALO_VENDAS = "SELECT (SELECT MIN(data) FROM vendas), (SELECT MAX(data) FROM vendas)"
+
+# Vendas de um SKU somadas por dia em todas as contas (previsão geral)
+CONSULTA_VENDAS_GERAL = ("SELECT data, SUM(quantidade) AS quantidade FROM vendas "
+                         "WHERE sku = ? AND contas IS NOT NULL AND data IS NOT NULL GROUP BY data ORDER BY data")
+
+# Tabelas temporárias (da conexão) usadas pelas gravações em lote e pelas consultas que as juntam com o banco
+TABELAS_TEMPORARIAS = {
+    'skus_alvo': "CREATE TEMP TABLE IF NOT EXISTS skus_alvo (sku TEXT PRIMARY KEY)",
+    'pares_lote': "CREATE TEMP TABLE IF NOT EXISTS pares_lote (par INTEGER PRIMARY KEY, contas TEXT, sku TEXT)",
+    'caminhos_afetados': "CREATE TEMP TABLE IF NOT EXISTS caminhos_afetados (caminho TEXT PRIMARY KEY)",
+    'chaves_afetadas': "CREATE TEMP TABLE IF NOT EXISTS chaves_afetadas (contas TEXT, sku TEXT, data DATE)",
+    'estoque_novo': "CREATE TEMP TABLE IF NOT EXISTS estoque_novo (sku TEXT, quantidade_itens INTEGER, quantidade_estoque REAL, data TEXT)",
+}
+
+# Vendas de um SKU (e de uma conta) para a previsão de um par
+CONSULTA_VENDAS_SKU = "SELECT sku, data, quantidade, contas FROM vendas WHERE sku = ? ORDER BY data"
+CONSULTA_VENDAS_SKU_CONTA = "SELECT sku, data, quantidade, contas FROM vendas WHERE sku = ? AND contas = ? ORDER BY data"
+CONSULTA_PARES_VENDAS = "SELECT DISTINCT sku, contas FROM vendas"
+
+# Previsão em lote: numera os pares (conta, sku), com FILTRO_SKUS_ALVO quando só alguns SKUs são previstos,
+# lê as vendas de todos eles de uma vez e apaga a previsão anterior ('{}' é a tabela)
+FILTRO_SKUS_ALVO = "AND sku IN (SELECT sku FROM skus_alvo)"
+CONSULTA_NUMERAR_PARES = """
+    INSERT INTO pares_lote (par, contas, sku)
+    SELECT ROW_NUMBER() OVER (ORDER BY contas, sku) - 1, contas, sku FROM (
+        SELECT DISTINCT contas, sku FROM vendas
+        WHERE contas IS NOT NULL AND sku IS NOT NULL AND julianday(data) IS NOT NULL
+        {})
+"""
+CONSULTA_VENDAS_LOTE = """
+    SELECT pares_lote.par, CAST(julianday(v.data) - julianday(?) AS INTEGER) AS dia, v.quantidade
+    FROM pares_lote JOIN vendas v ON v.sku = pares_lote.sku AND v.contas = pares_lote.contas
+    WHERE julianday(v.data) IS NOT NULL
+"""
+APAGAR_PREVISOES_SKUS_ALVO = 'DELETE FROM "{}" WHERE sku IN (SELECT sku FROM skus_alvo)'
+
+# Previsão gravada: coeficientes e linhas diárias de cada par, mais os filtros opcionais por SKU e conta
+FILTRO_SKU = " AND sku = ?"
+FILTRO_CONTA = " AND conta = ?"
+CONSULTA_COEFICIENTES = "SELECT {} FROM coeficientes_previsao WHERE 1 = 1"
+CONSULTA_PREVISOES_GRAVADAS = ("SELECT sku, data, quantidade_prevista, conta FROM previsão_futura p "
+                               "WHERE NOT EXISTS (SELECT 1 FROM coeficientes_previsao c WHERE c.sku = p.sku AND c.conta = p.conta)")
+APAGAR_PREVISAO_PAR = "DELETE FROM previsão_futura WHERE sku = ? AND conta = ?"
+APAGAR_COEFICIENTES_PAR = "DELETE FROM coeficientes_previsao WHERE sku = ? AND conta = ?"
+CONSULTA_PREVISAO_CACHE = ("SELECT horizonte, previsao FROM cache_previsoes WHERE sku = ? AND conta = ? AND impressao = ? "
+                           "ORDER BY horizonte DESC LIMIT 1")
+GRAVAR_PREVISAO_CACHE = "INSERT INTO cache_previsoes VALUES (?, ?, ?, ?, ?, ?)"
+APAGAR_CACHE_PAR = "DELETE FROM cache_previsoes WHERE sku = ? AND conta = ?"
+CONTAR_PREVISAO_PAR = "SELECT COUNT(*) FROM previsão_futura WHERE sku = ? AND conta = ?"
+
+# Estoque: a carga atual e o histórico de um SKU (o mais recente primeiro), a carga de todos os SKUs e a troca
+# do histórico pelas datas da carga nova
+CONSULTA_ESTOQUE_SKU = "SELECT sku, data, quantidade_estoque FROM estoque WHERE sku = ? ORDER BY data DESC"
+CONSULTA_HISTORICO_ESTOQUE_SKU = "SELECT sku, data, quantidade_estoque FROM estoque_historico WHERE sku = ? ORDER BY data DESC"
+CONSULTA_ESTOQUE = "SELECT sku, data, quantidade_estoque FROM estoque ORDER BY sku, data DESC"
+APAGAR_HISTORICO_DA_CARGA = "DELETE FROM estoque_historico WHERE data IN (SELECT DISTINCT data FROM estoque_novo)"
+
+# Carga incremental das vendas: contribuições dos arquivos alterados e as chaves (conta, sku, data) refeitas.
+# O CROSS JOIN fixa a ordem: percorre as chaves afetadas e busca cada uma no índice de 'vendas_por_arquivo'
+CONSULTA_CHAVES_ARQUIVOS = "SELECT DISTINCT contas, sku, data FROM vendas_por_arquivo WHERE caminho IN (SELECT caminho FROM caminhos_afetados)"
+APAGAR_CONTRIBUICOES_ARQUIVOS = "DELETE FROM vendas_por_arquivo WHERE caminho IN (SELECT caminho FROM caminhos_afetados)"
+CONSULTA_SOMA_CHAVES = """
+    SELECT v.contas, v.sku, v.data,
+           SUM(v.quantidade_itens) AS quantidade_itens,
+           SUM(v.quantidade_total) AS quantidade_total,
+           SUM(v.quantidade) AS quantidade
+    FROM chaves_afetadas
+    CROSS JOIN vendas_por_arquivo v
+        ON v.contas = chaves_afetadas.contas AND v.sku = chaves_afetadas.sku AND v.data = chaves_afetadas.data
+    GROUP BY v.contas, v.sku, v.data
+    ORDER BY v.contas, v.sku, v.data
+"""
+APAGAR_VENDAS_CHAVES = "DELETE FROM vendas WHERE (contas, sku, data) IN (SELECT contas, sku, data FROM chaves_afetadas)"
+
+# Consultas mais usadas, as mesmas constantes que o código executa; verificar_plano_consultas confere se todas
+# usam índice
+CONSULTAS_QUENTES = {
+    'vendas por sku e conta': (CONSULTA_VENDAS_SKU_CONTA, ('', '')),
+    'vendas por sku': (CONSULTA_VENDAS_SKU, ('',)),
+    'vendas do sku por dia': (CONSULTA_VENDAS_GERAL, ('',)),
+    'intervalo das vendas': (CONSULTA_INTERVALO_VENDAS, ()),
+    'pares de vendas': (CONSULTA_PARES_VENDAS, ()),
+    'skus das vendas': (CONSULTA_SKUS_CATALOGO.format('vendas'), ()),
+    'skus do estoque': (CONSULTA_SKUS_CATALOGO.format('estoque'), ()),
+    'skus da previsão': (CONSULTA_SKUS_CATALOGO.format('previsão_futura'), ()),
+    'pares do lote': (CONSULTA_NUMERAR_PARES.format(''), ()),
+    'pares do lote por sku': (CONSULTA_NUMERAR_PARES.format(FILTRO_SKUS_ALVO), ()),
+    'vendas dos pares do lote': (CONSULTA_VENDAS_LOTE, ('',)),
+    'apagar previsão dos skus do lote': (APAGAR_PREVISOES_SKUS_ALVO.format('previsão_futura'), ()),
+    'apagar coeficientes dos skus do lote': (APAGAR_PREVISOES_SKUS_ALVO.format('coeficientes_previsao'), ()),
+    'apagar cache dos skus do lote': (APAGAR_PREVISOES_SKUS_ALVO.format('cache_previsoes'), ()),
+    'previsão gravada por sku e conta': (CONSULTA_PREVISOES_GRAVADAS + FILTRO_SKU + FILTRO_CONTA, ('', '')),
+    'previsão gravada por sku': (CONSULTA_PREVISOES_GRAVADAS + FILTRO_SKU, ('',)),
+    'apagar previsão do par': (APAGAR_PREVISAO_PAR, ('', '')),
+    'apagar coeficientes do par': (APAGAR_COEFICIENTES_PAR, ('', '')),
+    'coeficientes por sku e conta': (CONSULTA_COEFICIENTES.format('*') + FILTRO_SKU + FILTRO_CONTA, ('', '')),
+    'coeficientes por sku': (CONSULTA_COEFICIENTES.format('*') + FILTRO_SKU, ('',)),
+    'previsão em cache': (CONSULTA_PREVISAO_CACHE, ('', '', '')),
+    'apagar cache do par': (APAGAR_CACHE_PAR, ('', '')),
+    'dias previstos do par': (CONTAR_PREVISAO_PAR, ('', '')),
+    'estoque por sku': (CONSULTA_ESTOQUE_SKU, ('',)),
+    'histórico do estoque por sku': (CONSULTA_HISTORICO_ESTOQUE_SKU, ('',)),
+    'estoque de todos os skus': (CONSULTA_ESTOQUE, ()),
+    'histórico das datas da carga': (APAGAR_HISTORICO_DA_CARGA, ()),
+    'chaves dos arquivos alterados': (CONSULTA_CHAVES_ARQUIVOS, ()),
+    'apagar contribuições dos arquivos': (APAGAR_CONTRIBUICOES_ARQUIVOS, ()),
+    'soma das chaves afetadas': (CONSULTA_SOMA_CHAVES, ()),
+    'apagar vendas das chaves afetadas': (APAGAR_VENDAS_CHAVES, ()),
+}
+
+# Consultas de CONSULTAS_QUENTES que leem a tabela inteira de propósito (todos os pares para a previsão em lote,
+# o estoque de todos os SKUs para a projeção em lote)
+VARREDURAS_ESPERADAS = {'pares de vendas', 'estoque de todos os skus'}
+
+# Tempo máximo de importação do app.py (python -X importtime) e módulos que não podem ser carregados nela
+LIMITE_INICIALIZACAO_MS = 1500
+MODULOS_PREGUICOSOS = ('matplotlib', 'sklearn')
+
+# Colunas de texto repetitivas que ficam como categoria nos DataFrames grandes (cada valor é guardado uma vez só)
+COLUNAS_CATEGORICAS = ('contas', 'conta', 'sku', 'data', 'caminho')
+
+# Com False tipos_compactos não muda nada: os DataFrames ficam com texto e datetime64, como antes. Só para a
+# linha de base de benchmark_memoria
+COMPACTAR_TIPOS = True
+
+# Etapas medidas por benchmark_memoria, cada uma num processo novo: nome -> (função do app.py chamada sem
+# argumentos, função do caminho antigo com texto e datetime64 que serve de linha de base)
+ETAPAS_MEMORIA = {
+    'leitura das vendas': ('agrupar_arquivos_vendas', 'agrupar_arquivos_vendas_objetos'),
+    'previsão em lote': ('previsao_vendas_em_lote', 'previsao_lote_objetos'),
+    'projeção do estoque': ('projetar_estoque_em_lote', 'projecao_lote_objetos'),
+}
+
+# Métricas das etapas (ver etapa): cada etapa concluída vira uma linha JSON neste arquivo (None não grava).
+# Passando de TAMANHO_MAXIMO_METRICAS no início de uma execução, o arquivo vira '<arquivo>.1' (só a anterior
+# fica guardada). EXECUCAO identifica a rodada; os processos do pool recebem o valor em iniciar_processo
+ARQUIVO_METRICAS = os.path.join(PASTA_SAIDA, 'metricas.jsonl')
+TAMANHO_MAXIMO_METRICAS = 10 * 1024 * 1024
+EXECUCAO = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+METRICAS = []
+ETAPAS_ABERTAS = []
+
+# Benchmark do pipeline sobre dados sintéticos (ver benchmark_pipeline): escala padrão (SKUs, dias, linhas por
+# arquivo de vendas e arquivos por conta) e arquivo onde cada rodada é acrescentada, com o commit, para comparar versões
+ESCALA_BENCHMARK = {'skus': 500, 'dias': 365, 'linhas_por_arquivo': 5000, 'arquivos_por_conta': 2}
+ARQUIVO_BENCHMARK = os.path.join(PASTA_SAIDA, 'benchmark.jsonl')
+
+# Gráficos: pontos máximos por linha (as séries diárias são reduzidas mantendo os picos), até quantos pontos
+# a linha leva marcadores, SKUs por tarefa na gravação em lote e tamanho (polegadas) e resolução das imagens
+PONTOS_POR_LINHA = 400
+PONTOS_COM_MARCADOR = 31
+GRAFICOS_POR_TAREFA = 100
+TAMANHO_GRAFICO = (10, 5)
+DPI_GRAFICO = 100
+
 # Nome das contas (usado para acessar as subpastas)
 CONTAS = {
     'A':'B',
@@ -27,10 +300,266 @@ CONTAS = {
     'D':'P',
 }
 
+# Importa o pyplot na primeira vez que um gráfico é mostrado. Sem tela (ex:. servidor Linux sem DISPLAY)
+# usa o backend Agg, que só grava arquivos
+def carregar_graficos():
+    import matplotlib
+    if 'MPLBACKEND' not in os.environ and sys.platform.startswith('linux') \
+            and not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY')):
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+# pyarrow é opcional: sem ele o cache dos arquivos de vendas fica desligado
+@lru_cache(maxsize=None)
+def carregar_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+    except ImportError:
+        return None
+    return pa
+
+# readline é opcional (não existe no Windows): sem ele o menu não completa o SKU com TAB
+@lru_cache(maxsize=None)
+def carregar_readline():
+    try:
+        import readline
+    except ImportError:
+        return None
+    return readline
+
+# Mede a importação do app.py com 'python -X importtime' (mediana de 'repeticoes' rodadas) e mostra os módulos
+# mais pesados. Retorna False se passar de limite_ms ou se algum de MODULOS_PREGUICOSOS for importado
+def benchmark_inicializacao(repeticoes=5, limite_ms=LIMITE_INICIALIZACAO_MS):
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    tempos = []
+    for _ in range(repeticoes):
+        resultado = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                                   cwd=pasta, capture_output=True, text=True, check=True)
+        modulos = {}
+        filhos, diretos = [], []
+        for linha in resultado.stderr.splitlines():
+            partes = linha.split('|')
+            if not linha.startswith('import time:') or len(partes) != 3 or not partes[1].strip().isdigit():
+                continue
+            # O importtime lista cada módulo depois dos que ele importou, dois espaços mais para dentro
+            nome, ms = partes[2].strip(), int(partes[1]) / 1000
+            recuo = len(partes[2]) - len(partes[2].lstrip())
+            modulos[nome] = ms
+            if recuo == 3:
+                filhos.append((ms, nome))
+            elif recuo == 1:
+                if nome == 'app':
+                    diretos = sorted(filhos, reverse=True)
+                filhos = []
+        tempos.append(modulos['app'])
+
+    mediana = float(np.median(tempos))
+    carregados = [nome for nome in modulos if nome.split('.')[0] in MODULOS_PREGUICOSOS]
+
+    print(f"Importação do app.py: {mediana:.0f} ms (limite {limite_ms} ms)")
+    for ms, nome in diretos[:8]:
+        print(f"{nome:>25}: {ms:8.1f} ms")
+    if carregados:
+        print(f"⚠️ Módulos que deveriam ser carregados só quando usados: {', '.join(sorted(carregados))}")
+
+    return mediana <= limite_ms and not carregados
+
+# Pico de memória residente (RSS) do processo em MB; None onde não há o módulo resource (Windows).
+# No Linux vem do VmHWM em /proc, que começa do zero a cada exec: o ru_maxrss passa para o programa executado
+# o pico do processo que o chamou
+def pico_memoria_mb():
+    try:
+        with open('/proc/self/status') as status:
+            for linha in status:
+                if linha.startswith('VmHWM:'):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # O Linux informa em KB e o macOS em bytes
+    return pico / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+# Mede o pico de memória (RSS) de cada etapa de ETAPAS_MEMORIA num processo novo, sobre uma cópia do banco
+# (o banco de verdade não é alterado): primeiro o caminho antigo (linha de base, COMPACTAR_TIPOS = False) e
+# depois o atual. Mostra os dois picos da etapa, descontado o pico logo após importar o app.py. A etapa roda
+# toda nesse processo (PROCESSOS_LEITURA = 1), senão a leitura dos arquivos ficaria nos processos filhos.
+# Retorna nome -> {'base': (pico após importar, pico da etapa), 'atual': (...)}
+def benchmark_memoria(etapas=None):
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    codigo = ("import sys; sys.path.insert(0, sys.argv[1]); import app; app.definir_banco(sys.argv[2]); "
+              "app.PROCESSOS_LEITURA = 1; app.COMPACTAR_TIPOS = sys.argv[4] == 'atual'; antes = app.pico_memoria_mb(); "
+              "getattr(app, sys.argv[3])(); print(antes, app.pico_memoria_mb())")
+    resultados = {}
+
+    with tempfile.TemporaryDirectory() as temporaria:
+        copia = os.path.join(temporaria, os.path.basename(BANCO_DE_DADOS))
+        with sqlite3.connect(BANCO_DE_DADOS) as origem, sqlite3.connect(copia) as destino:
+            origem.backup(destino)
+        origem.close()
+        destino.close()
+
+        for nome in etapas or ETAPAS_MEMORIA:
+            atual, base = ETAPAS_MEMORIA[nome]
+            for caminho, funcao in (('base', base), ('atual', atual)):
+                # Cache de leitura novo: as duas medidas leem os arquivos do zero
+                shutil.rmtree(os.path.join(temporaria, 'cache_vendas'), ignore_errors=True)
+                resultado = subprocess.run([sys.executable, '-c', codigo, pasta, copia, funcao, caminho],
+                                           capture_output=True, text=True, check=True)
+                antes, depois = resultado.stdout.split()[-2:]
+                if depois == 'None':
+                    print("Pico de memória indisponível neste sistema (sem o módulo resource).")
+                    return None
+                resultados.setdefault(nome, {})[caminho] = (float(antes), float(depois))
+
+            (antes_base, pico_base), (antes_atual, pico_atual) = resultados[nome]['base'], resultados[nome]['atual']
+            print(f"{nome:>20}: pico {pico_atual:8.1f} MB ({pico_atual - antes_atual:+8.1f} MB após a importação) | "
+                  f"antes {pico_base:8.1f} MB ({pico_base - antes_base:+8.1f} MB) | "
+                  f"{(pico_atual - antes_atual) / max(pico_base - antes_base, 1e-9):.2f}x")
+
+    return resultados
+
+# Linha de base de benchmark_memoria para a leitura das vendas: a mesma leitura com texto em vez de categorias
+def agrupar_arquivos_vendas_objetos():
+    global COMPACTAR_TIPOS
+    COMPACTAR_TIPOS = False
+    return agrupar_arquivos_vendas()
+
+# Linha de base de benchmark_memoria para a previsão em lote: a leitura de antes dos tipos compactos, com as
+# vendas em texto, a data em datetime64 e a matriz densa pares x dias das somas diárias, e as linhas diárias
+# de todos os pares montadas de uma vez (nada é gravado)
+def previsao_lote_objetos(horizonte=HORIZONTE_PADRAO):
+    conn = conexao(somente_leitura=True)
+    vendas = pd.read_sql_query("SELECT sku, data, quantidade, contas FROM vendas", conn)
+    vendas = vendas.dropna(subset=['sku', 'contas', 'data'])
+    if vendas.empty:
+        return None
+    vendas['data'] = pd.to_datetime(vendas['data'])
+    vendas['quantidade'] = pd.to_numeric(vendas['quantidade'], errors='coerce').fillna(0)
+
+    par = vendas.groupby(['contas', 'sku']).ngroup().to_numpy()
+    data_inicio_global, data_fim_global = intervalo_vendas(conn)
+    dia = (vendas['data'] - data_inicio_global).dt.days.to_numpy()
+    n_pares, n_dias = int(par.max()) + 1, (data_fim_global - data_inicio_global).days + 1
+    Y = np.bincount(par * n_dias + dia, weights=vendas['quantidade'].to_numpy(dtype=float),
+                    minlength=n_pares * n_dias).reshape(n_pares, n_dias)
+    return Y, calcular_previsoes(ler_coeficientes(conn), horizonte)
+
+# Linha de base de benchmark_memoria para a projeção do estoque: a previsão de todos os pares como a tabela
+# longa de ler_previsoes, com a data em texto e depois em datetime64 (nada é projetado)
+def projecao_lote_objetos(horizonte=HORIZONTE_PADRAO):
+    conn = conexao(somente_leitura=True)
+    estoque = pd.read_sql_query(CONSULTA_ESTOQUE, conn)
+    pv = ler_previsoes(conn, horizonte=horizonte)
+    pv = pv.groupby(['sku', 'data'], as_index=False)['quantidade_prevista'].sum()
+    pv = pv[pv['sku'].isin(estoque['sku'])].copy()
+    pv['data'] = pd.to_datetime(pv['data'])
+    return estoque, pv
+
+# Mede uma etapa do processamento: tempo, linhas (quem chama preenche registro['linhas']) e pico de memória do
+# processo ao final. Etapas podem ser aninhadas; cada uma fica em METRICAS e é gravada em ARQUIVO_METRICAS
+@contextmanager
+def etapa(nome, **campos):
+    registro = {'execucao': EXECUCAO, 'etapa': nome, 'pai': ETAPAS_ABERTAS[-1] if ETAPAS_ABERTAS else None,
+                'pid': os.getpid(), 'inicio': datetime.now().isoformat(timespec='milliseconds'), **campos}
+    ETAPAS_ABERTAS.append(nome)
+    comeco = time.perf_counter()
+    try:
+        yield registro
+    except Exception as e:
+        registro['erro'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        ETAPAS_ABERTAS.pop()
+        registro['duracao_s'] = round(time.perf_counter() - comeco, 6)
+        registro['pico_mb'] = pico_memoria_mb()
+        METRICAS.append(registro)
+        gravar_metrica(registro)
+
+# Decorador: a função inteira é medida como uma etapa
+def medido(nome):
+    def decorador(funcao):
+        @wraps(funcao)
+        def medida(*args, **kwargs):
+            with etapa(nome):
+                return funcao(*args, **kwargs)
+        return medida
+    return decorador
+
+# Acrescenta uma métrica em ARQUIVO_METRICAS como uma linha JSON
+def gravar_metrica(registro):
+    if not ARQUIVO_METRICAS:
+        return
+    try:
+        os.makedirs(os.path.dirname(ARQUIVO_METRICAS) or '.', exist_ok=True)
+        with open(ARQUIVO_METRICAS, 'a', encoding='utf-8') as arquivo:
+            arquivo.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+    except OSError as e:
+        print(f"Não foi possível gravar as métricas em {ARQUIVO_METRICAS}: {e}")
+
+# Guarda o arquivo de métricas como '<arquivo>.1' (substituindo o anterior) se passou de 'tamanho_maximo'.
+# Roda no início da execução, antes de qualquer etapa, para ler_metricas achar todas as linhas da rodada
+def rotacionar_metricas(tamanho_maximo=TAMANHO_MAXIMO_METRICAS):
+    if not ARQUIVO_METRICAS or not os.path.exists(ARQUIVO_METRICAS):
+        return
+    try:
+        if os.path.getsize(ARQUIVO_METRICAS) > tamanho_maximo:
+            os.replace(ARQUIVO_METRICAS, ARQUIVO_METRICAS + '.1')
+    except OSError as e:
+        print(f"Não foi possível rotacionar as métricas em {ARQUIVO_METRICAS}: {e}")
+
+# Métricas desta execução a partir de 'desde' (datetime), inclusive as medidas nos processos de leitura,
+# que só aparecem no arquivo
+def ler_metricas(desde=None):
+    registros = METRICAS
+    if ARQUIVO_METRICAS and os.path.exists(ARQUIVO_METRICAS):
+        with open(ARQUIVO_METRICAS, encoding='utf-8') as arquivo:
+            registros = [json.loads(linha) for linha in arquivo if EXECUCAO in linha]
+        registros = [r for r in registros if r.get('execucao') == EXECUCAO]
+    if desde is not None:
+        registros = [r for r in registros if r['inicio'] >= desde.isoformat(timespec='milliseconds')]
+    return registros
+
+# Tabela de resumo por etapa (na ordem em que começaram): vezes, tempo total e máximo, linhas e maior pico de memória
+def resumo_metricas(desde=None):
+    registros = ler_metricas(desde)
+    if not registros:
+        return None
+    metricas = pd.DataFrame(registros).reindex(columns=['etapa', 'inicio', 'duracao_s', 'linhas', 'pico_mb'])
+    resumo = metricas.groupby('etapa').agg(
+        inicio=('inicio', 'min'), vezes=('etapa', 'size'), total_s=('duracao_s', 'sum'),
+        maximo_s=('duracao_s', 'max'), linhas=('linhas', lambda linhas: linhas.sum(min_count=1)), pico_mb=('pico_mb', 'max'),
+    ).sort_values('inicio').drop(columns='inicio')
+    resumo['linhas'] = resumo['linhas'].map(lambda linhas: '-' if pd.isna(linhas) else f"{int(linhas):,}")
+
+    print("\nResumo das etapas:")
+    print(resumo.to_string(float_format=lambda valor: f"{valor:,.2f}"))
+    return resumo
+
+# Roda funcao(*args) com o cProfile e grava as estatísticas em 'caminho' (abrir com pstats ou snakeviz);
+# mostra as funções com mais tempo acumulado. Só o processo principal é perfilado (use --workers 1 para a leitura)
+def com_perfil(caminho, funcao, *args):
+    import cProfile
+    import pstats
+
+    perfil = cProfile.Profile()
+    try:
+        return perfil.runcall(funcao, *args)
+    finally:
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        perfil.dump_stats(caminho)
+        print(f"\nPerfil gravado em {caminho}. Funções com mais tempo acumulado:")
+        pstats.Stats(perfil).sort_stats('cumulative').print_stats(25)
+
 # Banco de dados
-def banco_dados():
+def banco_dados(caminho=None):
     #criando banco de dados
-    conn = sqlite3.connect(BANCO_DE_DADOS)
+    conn = sqlite3.connect(caminho or BANCO_DE_DADOS)
     CURSOR = conn.cursor()
 
     CURSOR.execute("""
@@ -64,20 +593,293 @@ def banco_dados():
                     conta TEXT          
                    );
     """)
+    migrar_banco(conn)
     print("Tabela criada com exito")
     #fechando a sessão
     conn.close()
 
+# Tabelas da atualização incremental das vendas: o manifesto dos arquivos já lidos
+# e a contribuição de cada arquivo por (conta, sku, data). Criadas também em bancos antigos
+def garantir_tabelas_incrementais(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS manifesto_arquivos (
+                   caminho TEXT NOT NULL PRIMARY KEY,
+                   conta TEXT,
+                   tamanho INTEGER,
+                   mtime REAL,
+                   hash TEXT,
+                   data_processamento TEXT
+    );
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS vendas_por_arquivo (
+                   caminho TEXT,
+                   contas TEXT,
+                   sku TEXT,
+                   data DATE,
+                   quantidade_itens INTEGER,
+                   quantidade_total INTEGER,
+                   quantidade INTEGER
+    );
+    """)
+
+# Previsões guardadas por comparacao_previsao_vendas: a série prevista (float64 em bytes) e a impressão
+# digital do histórico usado. conta = '' é a previsão com todas as contas somadas
+def garantir_tabela_cache_previsoes(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS cache_previsoes (
+                   sku TEXT NOT NULL,
+                   conta TEXT NOT NULL,
+                   horizonte INTEGER NOT NULL,
+                   impressao TEXT,
+                   previsao BLOB,
+                   data_processamento TEXT,
+                   PRIMARY KEY (sku, conta, horizonte)
+    );
+    """)
+
+# Coeficientes da função quadrática de cada par (sku, conta): previsto = intercepto + coef_t * t + coef_t2 * t²,
+# com t em dias desde data_origem, para os dias seguintes a ultima_data (ver calcular_previsoes)
+def garantir_tabela_coeficientes(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS coeficientes_previsao (
+                   sku TEXT NOT NULL,
+                   conta TEXT NOT NULL,
+                   intercepto REAL,
+                   coef_t REAL,
+                   coef_t2 REAL,
+                   data_origem TEXT,
+                   ultima_data TEXT,
+                   PRIMARY KEY (sku, conta)
+    );
+    """)
+
+# Previsão geral de um SKU (todas as contas somadas, opção 4): um só conjunto de coeficientes por SKU, no mesmo
+# formato de 'coeficientes_previsao'. Só existe para a migração 5; a 6 apaga a tabela (a previsão geral fica
+# em 'cache_previsoes')
+def garantir_tabela_previsao_geral(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS coeficientes_previsao_geral (
+                   sku TEXT NOT NULL PRIMARY KEY,
+                   intercepto REAL,
+                   coef_t REAL,
+                   coef_t2 REAL,
+                   data_origem TEXT,
+                   ultima_data TEXT,
+                   data_processamento TEXT
+    );
+    """)
+
+# Histórico do estoque: uma cópia de cada carga, com a data da carga. WITHOUT ROWID com chave (sku, data)
+# deixa as linhas de um SKU juntas e sem coluna extra
+def garantir_tabela_historico_estoque(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS estoque_historico (
+                   sku TEXT NOT NULL,
+                   data TEXT NOT NULL,
+                   quantidade_itens INTEGER,
+                   quantidade_estoque REAL,
+                   PRIMARY KEY (sku, data)
+    ) WITHOUT ROWID;
+    """)
+    criar_indices(conn, 'estoque_historico')
+
+# Cria os índices de INDICES para a tabela, se ela existir
+def criar_indices(conn, tabela):
+    existe = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,)).fetchone()
+    if not existe:
+        return
+    for nome, colunas in INDICES[tabela].items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {nome} ON {tabela} {colunas}")
+
+# Migrações do esquema, em ordem. A versão aplicada fica em PRAGMA user_version do próprio banco;
+# uma migração publicada nunca muda de número nem de conteúdo (as correções entram como migrações novas)
+MIGRACOES = [
+    # 1: tabelas da atualização incremental e índices de busca por sku/conta/data
+    lambda conn: (garantir_tabelas_incrementais(conn), [criar_indices(conn, tabela) for tabela in INDICES]),
+    # 2: cache das previsões por SKU
+    garantir_tabela_cache_previsoes,
+    # 3: coeficientes das previsões (valores calculados na leitura)
+    garantir_tabela_coeficientes,
+    # 4: histórico das cargas do estoque
+    garantir_tabela_historico_estoque,
+    # 5: previsão geral (todas as contas) gravada uma vez por SKU
+    garantir_tabela_previsao_geral,
+    # 6: sem a tabela da previsão geral (duplicava 'cache_previsoes') e com o índice de 'vendas' por data
+    lambda conn: (conn.execute("DROP TABLE IF EXISTS coeficientes_previsao_geral"), criar_indices(conn, 'vendas')),
+]
+
+# Atualiza um banco (novo ou antigo) aplicando as migrações que faltam
+def migrar_banco(conn):
+    versao = conn.execute("PRAGMA user_version").fetchone()[0]
+    for numero, migracao in enumerate(MIGRACOES[versao:], start=versao + 1):
+        migracao(conn)
+        conn.execute(f"PRAGMA user_version = {numero}")
+        print(f"Banco de dados migrado para a versão {numero}.")
+    conn.commit()
+
+# Mostra o plano (EXPLAIN QUERY PLAN) de cada consulta de CONSULTAS_QUENTES e retorna as que leem tabela sem índice:
+# toda busca (SEARCH) precisa dizer o índice usado, e varredura (SCAN) de tabela, mesmo por índice, só nas
+# consultas de VARREDURAS_ESPERADAS
+def verificar_plano_consultas(caminho=None):
+    conn = conexao(somente_leitura=True, caminho=caminho)
+    for criar in TABELAS_TEMPORARIAS.values():
+        conn.execute(criar)
+
+    sem_indice = {}
+    for nome, (consulta, params) in CONSULTAS_QUENTES.items():
+        plano = [linha[3] for linha in conn.execute(f"EXPLAIN QUERY PLAN {consulta}", params)]
+        buscas = [passo for passo in plano if passo.startswith('SEARCH')]
+        # Percorrer as tabelas temporárias, as subconsultas e a linha constante é esperado; as do banco, não
+        varreduras = [passo for passo in plano if passo.startswith('SCAN')
+                      and passo.split()[1] not in TABELAS_TEMPORARIAS and not passo.split()[1].startswith(('(', 'CONSTANT'))]
+        usa_indice = all('USING' in passo for passo in buscas) and (not varreduras or nome in VARREDURAS_ESPERADAS)
+        print(f"{'✅' if usa_indice else '⚠️'} {nome}: {' | '.join(plano)}")
+        if not usa_indice:
+            sem_indice[nome] = plano
+    return sem_indice
+
+# Hash do conteúdo do arquivo, lido em blocos
+def hash_arquivo(caminho, tamanho_bloco=1 << 20):
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+# Abre uma conexão com os PRAGMAs de escrita aplicados
+def conectar_escrita(caminho=None):
+    conn = sqlite3.connect(caminho or BANCO_DE_DADOS)
+    for pragma, valor in PRAGMAS_ESCRITA.items():
+        conn.execute(f"PRAGMA {pragma} = {valor}")
+    return conn
+
+# Conexão da sessão com o banco, aberta na primeira chamada e reaproveitada nas seguintes (do mesmo processo e
+# thread). A de escrita tem os PRAGMAS_ESCRITA (WAL); a somente_leitura abre o arquivo em mode=ro com os
+# PRAGMAS_LEITURA e, com o banco em WAL, lê enquanto outro processo grava. Não deve ser fechada por quem usa:
+# fechar_conexoes fecha todas no fim do processo ou na troca de banco
+def conexao(somente_leitura=False, caminho=None):
+    caminho = caminho or BANCO_DE_DADOS
+    chave = (os.getpid(), threading.get_ident(), caminho, somente_leitura)
+    conn = CONEXOES.get(chave)
+    if conn is not None:
+        return conn
+
+    if not REUSAR_CONEXOES:
+        # Como antes do reaproveitamento: conexão nova, sem ajustes, fechada quando sai de uso
+        return sqlite3.connect(caminho)
+
+    if somente_leitura:
+        conn = sqlite3.connect(f"{Path(caminho).absolute().as_uri()}?mode=ro", uri=True,
+                               cached_statements=COMANDOS_PREPARADOS, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(caminho, cached_statements=COMANDOS_PREPARADOS, check_same_thread=False)
+    for pragma, valor in (PRAGMAS_LEITURA if somente_leitura else PRAGMAS_ESCRITA).items():
+        conn.execute(f"PRAGMA {pragma} = {valor}")
+    CONEXOES[chave] = conn
+    return conn
+
+# Fecha as conexões da sessão abertas por este processo, de todas as threads (as herdadas do processo pai
+# ficam com ele). Cada conexão só é usada pela thread que a abriu; check_same_thread=False é só para poder fechá-la aqui
+@atexit.register
+def fechar_conexoes():
+    for chave in [chave for chave in CONEXOES if chave[0] == os.getpid()]:
+        CONEXOES.pop(chave).close()
+
+# Converte uma coluna do DataFrame em lista de valores aceitos pelo sqlite (datas viram 'AAAA-MM-DD')
+def coluna_para_sqlite(coluna):
+    if pd.api.types.is_datetime64_any_dtype(coluna):
+        coluna = coluna.dt.strftime('%Y-%m-%d')
+    valores = coluna.to_numpy(dtype=object, copy=True)
+    valores[pd.isna(valores)] = None
+    return valores.tolist()
+
+# Grava um DataFrame numa tabela com executemany sobre as colunas, fazendo commit a cada tamanho_lote linhas.
+# Se 'conn' for passada, as gravações entram na transação já aberta nela (ex.: depois de um DELETE);
+# com confirmar=False o commit fica por conta de quem chamou
+def gravar_em_lote(tabela, df, colunas=None, conn=None, tamanho_lote=TAMANHO_LOTE, confirmar=True):
+    colunas = list(colunas if colunas is not None else df.columns)
+    linhas = zip(*(coluna_para_sqlite(df[coluna]) for coluna in colunas))
+    sql = f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})"
+
+    conexao_propria = conn is None
+    if conexao_propria:
+        conn = conectar_escrita()
+
+    total = 0
+    try:
+        while True:
+            lote = list(islice(linhas, tamanho_lote)) if tamanho_lote else list(linhas)
+            if not lote:
+                break
+            conn.executemany(sql, lote)
+            if confirmar:
+                conn.commit()
+            total += len(lote)
+            if not tamanho_lote:
+                break
+        # Garante o commit de operações anteriores da transação mesmo sem linhas
+        if confirmar:
+            conn.commit()
+    except Exception:
+        if confirmar:
+            conn.rollback()
+        raise
+    finally:
+        if conexao_propria:
+            conn.close()
+
+    return total
+
+# Compara a gravação linha a linha (iterrows) com gravar_em_lote e mostra linhas por segundo
+def benchmark_escrita(n_linhas=200000, tamanho_lote=TAMANHO_LOTE):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'sku': rng.integers(0, 5000, n_linhas).astype(str),
+        'quantidade_itens': rng.integers(0, 2, n_linhas),
+        'quantidade_total': rng.integers(0, 20, n_linhas),
+        'contas': rng.choice(list(CONTAS.values()), n_linhas),
+        'quantidade': rng.integers(0, 10, n_linhas),
+        'data': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 720, n_linhas), unit='D'),
+    })
+
+    resultados = {}
+    with tempfile.TemporaryDirectory() as pasta:
+        # Caminho atual: um INSERT por linha
+        caminho = os.path.join(pasta, 'linha_a_linha.db')
+        banco_dados(caminho)
+        inicio = time.perf_counter()
+        with sqlite3.connect(caminho) as conn:
+            cursor = conn.cursor()
+            for _, row in df.iterrows():
+                cursor.execute("""
+                    INSERT INTO vendas (sku, quantidade_itens, quantidade_total, contas ,quantidade, data)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (row['sku'], row['quantidade_itens'], row['quantidade_total'], row['contas'], row['quantidade'], row['data'].strftime('%Y-%m-%d') ))
+            conn.commit()
+        conn.close()
+        resultados['iterrows'] = n_linhas / (time.perf_counter() - inicio)
+
+        # Caminho novo: executemany em lotes com PRAGMAs de escrita
+        caminho = os.path.join(pasta, 'em_lote.db')
+        banco_dados(caminho)
+        inicio = time.perf_counter()
+        conn = conectar_escrita(caminho)
+        gravar_em_lote('vendas', df, conn=conn, tamanho_lote=tamanho_lote)
+        conn.close()
+        resultados['gravar_em_lote'] = n_linhas / (time.perf_counter() - inicio)
+
+    for metodo, linhas_por_segundo in resultados.items():
+        print(f"{metodo:>15}: {linhas_por_segundo:12,.0f} linhas/s")
+    print(f"Ganho: {resultados['gravar_em_lote'] / resultados['iterrows']:.1f}x")
+    return resultados
+
 # Traduzir datas que estão em inglês para português
 def traduzir_data(data_str):
-    meses = {
-        'janeiro': 'january', 'fevereiro': 'february', 'março': 'march', 'abril': 'april',
-        'maio': 'may', 'junho': 'june', 'julho': 'july', 'agosto': 'august',
-        'setembro': 'september', 'outubro': 'october', 'novembro': 'november', 'dezembro': 'december'
-    }
-    
+    from dateutil import parser
+
     if isinstance(data_str, str):
-        for pt, en in meses.items():
+        for pt, en in MESES_PT_EN.items():
             data_str = data_str.lower().replace(pt, en)
         try:
             return parser.parse(data_str, fuzzy=True)
@@ -85,6 +887,38 @@ def traduzir_data(data_str):
             return pd.NaT
     return pd.NaT
 
+# traduzir_data com cache, usado só para os textos que não casam com FORMATOS_DATA
+@lru_cache(maxsize=TAMANHO_CACHE_DATAS)
+def traduzir_data_cache(data_str):
+    return traduzir_data(data_str)
+
+# Versão por coluna de traduzir_data: trabalha sobre os textos distintos, tenta os formatos fixos
+# de forma vetorizada e só manda para o parser "fuzzy" o que sobrar
+def traduzir_data_coluna(coluna):
+    coluna = pd.Series(coluna)
+    unicos = pd.Series(coluna.dropna().unique(), dtype=object)
+    unicos = unicos[unicos.map(lambda valor: isinstance(valor, str))].reset_index(drop=True)
+
+    normalizado = unicos.str.lower()
+    for pt, en in MESES_PT_EN.items():
+        normalizado = normalizado.str.replace(pt, en, regex=False)
+
+    datas = pd.Series(pd.NaT, index=unicos.index, dtype=object)
+    pendentes = pd.Series(True, index=unicos.index)
+    for formato in FORMATOS_DATA:
+        if not pendentes.any():
+            break
+        convertidas = pd.to_datetime(normalizado[pendentes], format=formato, errors='coerce')
+        convertidas = convertidas[convertidas.notna()]
+        datas[convertidas.index] = list(convertidas)
+        pendentes[convertidas.index] = False
+
+    for i in pendentes[pendentes].index:
+        datas[i] = traduzir_data_cache(unicos[i])
+
+    mapa = pd.Series(datas.values, index=unicos.values)
+    return pd.to_datetime(coluna.map(mapa), errors='coerce')
+
 # para manter a data atual no estoque
 def data():
     data_f = datetime.today()
@@ -96,32 +930,8 @@ def chamar_funcao_banco():
     if not os.path.exists(BANCO_DE_DADOS):
         banco_dados()
     else:
-        banco_existe
-
-# Se banco existir, vai deletar toda a tabela do estoque para subistituir com os dados de estoque atualizados
-def banco_existe(novos_dados : dict):
-    conn = sqlite3.connect(BANCO_DE_DADOS)
-    cursor = conn.cursor()
-
-    data_atual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    # Atualiza TABELAS comuns (acrescenta com data)
-    for tabela, df in novos_dados.items():
-        if tabela == 'estoque':
-            # Descarta dados antigos e insere novos
-            cursor.execute(f"DROP TABLE IF EXISTS {tabela}")
-            df.to_sql(tabela, conn, index=False)
-            print(f"Tabela '{tabela}' recriada com novos dados.")
-        else:
-            df['data'] = data_atual
-            try:
-                df.to_sql(tabela, conn, if_exists='append', index=False)
-                print(f"Tabela '{tabela}' atualizada.")
-            except Exception as e:
-                print(f"Erro ao atualizar tabela '{tabela}': {e}")
-
-    conn.commit()
-    conn.close()
+        # Banco antigo: aplica as migrações que faltam (tabelas e índices novos)
+        migrar_banco(conexao())
 
 # Trata a sku para separ a quantidade do número do produto
 def tratar_SKU(sku):
@@ -157,27 +967,147 @@ def tratar_SKU(sku):
         print(f"Erro ao tratar SKU: {e}")
         return None, None
 
-# Faz a previsão das vendas para 360 dias, usando uma funsão linear quadratica 
-def comparacao_previsao_vendas(sku_desejado, conta_desejada=None, retornar_dados=False):  
-    conn = sqlite3.connect(BANCO_DE_DADOS)
+# Regra da primeira parte do SKU: vira '0' se for maior que 1 ou não for número
+def corrigir_parte1(parte1):
+    try:
+        if int(parte1) > 1:
+            return '0'
+    except ValueError:
+        return '0'
+    return parte1
+
+# Versão vetorizada de tratar_SKU: trata a coluna inteira de uma vez e devolve as colunas
+# 'quantidade_itens' e 'sku' com o mesmo resultado da função linha a linha
+def tratar_SKU_coluna(coluna):
+    coluna = pd.Series(coluna)
+    nulo = coluna.isna()
+    texto = coluna.astype(str).str.strip()
+
+    # Exatamente um hífen = duas partes
+    partes = texto.str.extract(r'^([^-]*)-([^-]*)$')
+    duas_partes = partes[0].notna() & ~nulo
+
+    # A correção da parte1 roda só sobre os valores distintos (normalmente poucos: '1', '2', ...)
+    parte1 = partes[0].str.strip()
+    correcoes = {valor: corrigir_parte1(valor) for valor in parte1[duas_partes].unique()}
+    parte1 = parte1.map(correcoes).astype(object).where(duas_partes, None)
+
+    # Sem duas partes, a segunda fica com o SKU inteiro; SKU nulo devolve None nas duas
+    parte2 = partes[1].str.strip().where(duas_partes, texto).astype(object).where(~nulo, None)
+
+    return pd.DataFrame({'quantidade_itens': parte1, 'sku': parte2}, index=coluna.index)
+
+# Compara tratar_SKU linha a linha com tratar_SKU_coluna em n_linhas SKUs sintéticos
+def benchmark_tratar_SKU(n_linhas=1000000):
+    rng = np.random.default_rng(0)
+    modelos = np.array(['1-{}', '2-{}', '{}', ' 1 - {} ', 'x-{}', '1-{}-B', '0-{}', '{}-'], dtype=object)
+    skus = pd.Series([m.format(n) for m, n in zip(rng.choice(modelos, n_linhas), rng.integers(0, 50000, n_linhas))], dtype=object)
+    skus[rng.random(n_linhas) < 0.01] = None
+
+    inicio = time.perf_counter()
+    esperado = skus.apply(lambda x: pd.Series(tratar_SKU(x)))
+    tempo_linha = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    resultado = tratar_SKU_coluna(skus)
+    tempo_coluna = time.perf_counter() - inicio
+
+    iguais = resultado.set_axis([0, 1], axis=1).equals(esperado)
+    print(f"{'tratar_SKU':>18}: {tempo_linha:8.2f} s")
+    print(f"{'tratar_SKU_coluna':>18}: {tempo_coluna:8.2f} s")
+    print(f"Ganho: {tempo_linha / tempo_coluna:.1f}x | resultados iguais: {iguais}")
+    return tempo_linha, tempo_coluna, iguais
+
+# Confere tratar_SKU_coluna contra tratar_SKU em n valores aleatórios e casos de borda: nulos (None, NaN, pd.NA),
+# inteiros, floats, vários hífens, dígitos não ASCII e espaços. Retorna os valores com resultado diferente
+def verificar_tratar_SKU(n=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    pedacos = ['0', '1', '2', '10', '-', '-', ' ', '\t', '\u00a0', 'A', 'b', 'x', '٣', '２', '½', 'ß', '.', '+']
+    bordas = [None, np.nan, pd.NA, 0, 1, 2, -1, 10, 1.0, 2.5, -0.0, float('inf'), '', ' ', '-', '--', '1-', '-1',
+              '1-2-3', ' 1 - A ', '٣-A', '２-A', '1\u00a0-\u00a0A', '+1-A', ' -1-A', '0001-A', '1.0-A']
+
+    valores = list(bordas)
+    for _ in range(n):
+        if rng.random() < 0.1:
+            # Números soltos, que na planilha chegam como int ou float
+            valores.append(int(rng.integers(-5, 100000)) if rng.random() < 0.5 else float(rng.normal(0, 1000)))
+        else:
+            valores.append(''.join(rng.choice(pedacos, rng.integers(0, 8))))
+
+    esperado = [tratar_SKU(valor) for valor in valores]
+    resultado = tratar_SKU_coluna(pd.Series(valores, dtype=object))
+    diferentes = [valor for valor, linha, coluna in zip(valores, esperado, zip(resultado['quantidade_itens'], resultado['sku']))
+                  if linha != coluna]
+
+    print(f"{'✅' if not diferentes else '⚠️'} tratar_SKU_coluna: {len(valores) - len(diferentes)}/{len(valores)} valores iguais a tratar_SKU")
+    for valor in diferentes[:10]:
+        print(f"   {valor!r}")
+    return diferentes
+
+# Intervalo global de datas da tabela 'vendas'; a série diária de todo par (conta, sku) vai de início a fim
+def intervalo_vendas(conn):
+    inicio, fim = conn.execute(CONSULTA_INTERVALO_VENDAS).fetchone()
+    if inicio is None:
+        return None, None
+    return pd.Timestamp(inicio), pd.Timestamp(fim)
+
+# A tabela 'vendas' guarda só os dias com registro; aqui cada par (contas, sku) é preenchido com zeros
+# em todos os dias entre inicio e fim, como era gravado antes
+def densificar_vendas(vendas, inicio, fim):
+    colunas_valores = [c for c in vendas.columns if c not in ('contas', 'sku', 'data')]
+    vendas = vendas.groupby(['contas', 'sku', 'data'])[colunas_valores].sum()
+
+    pares = vendas.index.droplevel('data').unique()
+    todas_as_datas = pd.date_range(start=inicio, end=fim, freq='D')
+    indice = pd.MultiIndex.from_arrays([
+        np.repeat(pares.get_level_values('contas'), len(todas_as_datas)),
+        np.repeat(pares.get_level_values('sku'), len(todas_as_datas)),
+        np.tile(todas_as_datas, len(pares)),
+    ], names=['contas', 'sku', 'data'])
+
+    return vendas.reindex(indice, fill_value=0).reset_index()
+
+# Lê as vendas de um SKU (e conta, se informada) já densificadas, no formato sku, data, quantidade, contas
+def ler_vendas_densas(sku_desejado, conta_desejada=None):
+    conn = conexao(somente_leitura=True)
+    inicio, fim = intervalo_vendas(conn)
     if conta_desejada:
-        query = "SELECT sku, data, quantidade, contas FROM vendas WHERE sku = ? AND contas = ? ORDER BY data"
+        query = CONSULTA_VENDAS_SKU_CONTA
         params = (sku_desejado, conta_desejada)
     else:
-        query = "SELECT sku, data, quantidade, contas FROM vendas WHERE sku = ? ORDER BY data"
+        query = CONSULTA_VENDAS_SKU
         params = (sku_desejado,)
-
     vendas = pd.read_sql_query(query, conn, params=params)
-    conn.close()
 
+    vendas = vendas.dropna(subset=['sku', 'contas', 'data'])
     if vendas.empty:
-        print(f"Não há dados suficientes para SKU '{sku_desejado}'" + (f" e conta '{conta_desejada}'." if conta_desejada else "."))
-        return (None, None, None) if retornar_dados else None
+        return vendas
 
     vendas['data'] = pd.to_datetime(vendas['data'])
+    vendas = densificar_vendas(vendas, inicio, fim)
+    return vendas[['sku', 'data', 'quantidade', 'contas']]
 
-    # Agrupa vendas por data, somando quantidade
-    grupo = vendas.groupby('data')['quantidade'].sum().reset_index()
+# Vendas de um SKU somadas por dia em todas as contas, com a soma feita no SQLite (uma linha por dia, não importa
+# quantas contas) e os dias sem venda preenchidos com zero no intervalo global, como em ler_vendas_densas.
+# Formato sku, data, quantidade
+def ler_vendas_geral(sku_desejado):
+    conn = conexao(somente_leitura=True)
+    inicio, fim = intervalo_vendas(conn)
+    vendas = pd.read_sql_query(CONSULTA_VENDAS_GERAL, conn, params=(sku_desejado,))
+
+    if vendas.empty:
+        return vendas
+
+    todas_as_datas = pd.date_range(start=inicio, end=fim, freq='D', name='data')
+    vendas['data'] = pd.to_datetime(vendas['data'])
+    vendas = vendas.set_index('data').reindex(todas_as_datas, fill_value=0).reset_index()
+    vendas.insert(0, 'sku', sku_desejado)
+    return vendas
+
+# Ajusta a função quadrática a uma série já somada por dia (data, quantidade). Devolve a série diária (dias sem
+# venda com zero, t = 0 no primeiro dia), a previsão dos 'horizonte' dias seguintes (valores >= 0) e o modelo
+def ajustar_serie(grupo, horizonte=HORIZONTE_PADRAO):
+    from sklearn.linear_model import LinearRegression
 
     grupo = grupo.sort_values('data').reset_index(drop=True)
 
@@ -195,25 +1125,33 @@ def comparacao_previsao_vendas(sku_desejado, conta_desejada=None, retornar_dados
 
     modelo = LinearRegression().fit(X, y)
 
-    # Criar dias futuros (360 dias)
-    dias_futuros = np.arange(grupo['t'].max() + 1, grupo['t'].max() + 361)
+    # Criar dias futuros (horizonte, HORIZONTE_PADRAO dias por padrão)
+    dias_futuros = np.arange(grupo['t'].max() + 1, grupo['t'].max() + horizonte + 1)
     dias_futuros_df = pd.DataFrame({'t': dias_futuros, 't2': dias_futuros ** 2})
 
-    # Previsões para os próximos 360 dias (valores >= 0)
+    # Previsões para os próximos dias (valores >= 0)
     vendas_previstas = modelo.predict(dias_futuros_df)
     vendas_previstas = np.maximum(vendas_previstas, 0)
 
-    previsoes_todas = []
+    return grupo, vendas_previstas, modelo
 
-    for (conta, sku), grupo in vendas.groupby(['contas', 'sku']):
-        grupo = grupo.copy()
-        grupo['data'] = pd.to_datetime(grupo['data'])
+# Ajusta a função quadrática às vendas (já densificadas) de um SKU. Retorna a série do último par (conta, sku),
+# a previsão, as linhas para 'previsão_futura' e os coeficientes de cada par; não grava nada no banco
+def ajustar_previsao(vendas, horizonte=HORIZONTE_PADRAO):
+    vendas['data'] = pd.to_datetime(vendas['data'])
 
-        # Pega a última data com registro
-        ultima_data = grupo['data'].max()
+    # Agrupa vendas por data, somando quantidade
+    grupo = vendas.groupby('data')['quantidade'].sum().reset_index()
+    grupo, vendas_previstas, modelo = ajustar_serie(grupo, horizonte)
+
+    data_origem = grupo['data'].min()
+    previsoes_todas = []
+    coeficientes = []
 
-        # Cria 360 dias futuros a partir do dia seguinte
-        datas_futuras = pd.date_range(start=ultima_data + pd.Timedelta(days=1), periods=360)
+    # Última data com registro de cada par, sem copiar as linhas de cada grupo
+    for (conta, sku), ultima_data in vendas.groupby(['contas', 'sku'])['data'].max().items():
+        # Cria os dias futuros a partir do dia seguinte
+        datas_futuras = pd.date_range(start=ultima_data + pd.Timedelta(days=1), periods=horizonte)
 
         df_previsao = pd.DataFrame({
             'sku': sku,
@@ -223,99 +1161,482 @@ def comparacao_previsao_vendas(sku_desejado, conta_desejada=None, retornar_dados
         })
 
         previsoes_todas.append(df_previsao)
+        coeficientes.append((sku, conta, modelo.intercept_, *modelo.coef_, data_origem.strftime('%Y-%m-%d'),
+                             ultima_data.strftime('%Y-%m-%d')))
 
     # Depois do loop que cria cada df_previsao e adiciona em previsoes_todas:
     df_previsao = pd.concat(previsoes_todas, ignore_index=True)
+    df_coeficientes = pd.DataFrame(coeficientes, columns=COLUNAS_COEFICIENTES)
+
+    # Série do último par (conta, sku) do loop
+    grupo = vendas[(vendas['contas'] == conta) & (vendas['sku'] == sku)]
+
+    return grupo, vendas_previstas, df_previsao, df_coeficientes
+
+# Troca, na transação de conn, a previsão dos 'pares' (sku, conta): grava os coeficientes e, com materializar
+# (padrão MATERIALIZAR_PREVISOES), também as linhas diárias em 'previsão_futura'. As previsões em cache dos
+# pares e a geral (conta '') dos SKUs são apagadas; as das outras contas continuam valendo. Não faz commit
+def gravar_previsoes_pares(conn, pares, df_previsao, df_coeficientes, materializar=None):
+    if materializar is None:
+        materializar = MATERIALIZAR_PREVISOES
+
+    chaves = {tuple(par) for par in pares} | {(sku, '') for sku, _ in pares}
+    conn.executemany(APAGAR_CACHE_PAR, chaves)
+    descartar_previsoes_memoria(chaves=chaves)
+    conn.executemany(APAGAR_PREVISAO_PAR, pares)
+    conn.executemany(APAGAR_COEFICIENTES_PAR, pares)
+    if df_coeficientes is None:
+        return
+    if materializar:
+        gravar_em_lote('previsão_futura', df_previsao, COLUNAS_PREVISAO, conn=conn, confirmar=False)
+    gravar_em_lote('coeficientes_previsao', df_coeficientes, COLUNAS_COEFICIENTES, conn=conn, confirmar=False)
+
+# Datas e valores diários da previsão de cada par de 'coeficientes' para os 'horizonte' dias seguintes à sua
+# ultima_data, como matrizes pares x dias (datetime64[D] e float)
+def matriz_previsoes(coeficientes, horizonte=HORIZONTE_PADRAO):
+    origem = pd.to_datetime(coeficientes['data_origem']).to_numpy().astype('datetime64[D]')
+    ultima_data = pd.to_datetime(coeficientes['ultima_data']).to_numpy().astype('datetime64[D]')
+    datas = ultima_data[:, None] + np.arange(1, horizonte + 1)
+
+    t = (datas - origem[:, None]).astype(float)
+    previstos = (coeficientes['intercepto'].to_numpy(dtype=float)[:, None]
+                 + coeficientes['coef_t'].to_numpy(dtype=float)[:, None] * t
+                 + coeficientes['coef_t2'].to_numpy(dtype=float)[:, None] * t ** 2)
+    return datas, np.maximum(previstos, 0)
+
+# Valores diários da previsão de cada par de 'coeficientes' no formato de 'previsão_futura'
+# (sku, data, quantidade_prevista, conta)
+def calcular_previsoes(coeficientes, horizonte=HORIZONTE_PADRAO):
+    datas, previstos = matriz_previsoes(coeficientes, horizonte)
+    return pd.DataFrame({
+        'sku': np.repeat(coeficientes['sku'].to_numpy(), horizonte),
+        'data': datas.ravel().astype(str),
+        'quantidade_prevista': previstos.ravel(),
+        'conta': np.repeat(coeficientes['conta'].to_numpy(), horizonte),
+    })
+
+# Filtro SQL (e parâmetros) por SKU e, se informada, conta; sem SKU não filtra
+def filtro_sku_conta(sku=None, conta=None):
+    filtro, params = '', ()
+    if sku is not None:
+        filtro, params = FILTRO_SKU, (sku,)
+        if conta is not None:
+            filtro, params = filtro + FILTRO_CONTA, params + (conta,)
+    return filtro, params
+
+# Coeficientes gravados (de um SKU, e conta, ou de todos)
+def ler_coeficientes(conn, sku=None, conta=None):
+    filtro, params = filtro_sku_conta(sku, conta)
+    return pd.read_sql_query(
+        CONSULTA_COEFICIENTES.format(', '.join(COLUNAS_COEFICIENTES)) + filtro, conn, params=params)
+
+# Linhas de 'previsão_futura' dos pares previstos antes dos coeficientes existirem, até 'horizonte' dias por par
+def ler_previsoes_gravadas(conn, sku=None, conta=None, horizonte=HORIZONTE_PADRAO):
+    filtro, params = filtro_sku_conta(sku, conta)
+    gravadas = pd.read_sql_query(CONSULTA_PREVISOES_GRAVADAS + filtro, conn, params=params)
+
+    # As linhas gravadas podem ir além do horizonte pedido
+    if not gravadas.empty:
+        gravadas = gravadas.sort_values(['sku', 'conta', 'data'])
+        gravadas = gravadas[gravadas.groupby(['sku', 'conta']).cumcount() < horizonte]
+    return gravadas
+
+# Lê a previsão de vendas (de um SKU, e conta, ou de todos) para os 'horizonte' primeiros dias: calculada dos
+# coeficientes do par e, para pares previstos antes dos coeficientes existirem, tirada de 'previsão_futura'
+def ler_previsoes(conn, sku=None, conta=None, horizonte=HORIZONTE_PADRAO):
+    coeficientes = ler_coeficientes(conn, sku, conta)
+    gravadas = ler_previsoes_gravadas(conn, sku, conta, horizonte)
+
+    partes = [df for df in (calcular_previsoes(coeficientes, horizonte), gravadas) if not df.empty]
+    if not partes:
+        return gravadas
+    previsoes = pd.concat(partes, ignore_index=True)
+    return previsoes.sort_values(['sku', 'conta', 'data'], ignore_index=True)
+
+# Impressão digital do histórico (já densificado) de um SKU: muda se qualquer conta, dia ou quantidade mudar,
+# inclusive quando o intervalo global de datas cresce
+def impressao_vendas(vendas):
+    colunas = [coluna for coluna in ('contas', 'data', 'quantidade') if coluna in vendas.columns]
+    valores = pd.util.hash_pandas_object(vendas[colunas], index=False)
+    return hashlib.sha1(valores.to_numpy().tobytes()).hexdigest()
+
+# Guarda a previsão na memória, descartando a usada há mais tempo quando passa de TAMANHO_CACHE_PREVISOES
+def guardar_previsao_memoria(chave, impressao, vendas_previstas):
+    CACHE_PREVISOES[chave] = (impressao, vendas_previstas)
+    CACHE_PREVISOES.move_to_end(chave)
+    while len(CACHE_PREVISOES) > TAMANHO_CACHE_PREVISOES:
+        CACHE_PREVISOES.popitem(last=False)
+
+# Tira da memória as previsões dos 'skus', ou só as 'chaves' (sku, conta), quando os coeficientes delas são
+# regravados. Sem nenhum dos dois tira todas
+def descartar_previsoes_memoria(skus=None, chaves=None):
+    if skus is None and chaves is None:
+        CACHE_PREVISOES.clear()
+        return
+    for chave in [chave for chave in CACHE_PREVISOES if (skus and chave[0] in skus) or (chaves and chave in chaves)]:
+        del CACHE_PREVISOES[chave]
+
+# Previsão de chave = (sku, conta) para 'horizonte' dias feita com o histórico 'impressao', procurada na memória
+# e depois na tabela 'cache_previsoes'. Uma previsão mais longa serve: os primeiros dias não dependem do
+# horizonte. None se não existe, se é mais curta ou se o histórico mudou desde então
+def buscar_previsao_cache(chave, impressao, horizonte):
+    if chave in CACHE_PREVISOES and CACHE_PREVISOES[chave][0] == impressao:
+        CACHE_PREVISOES.move_to_end(chave)
+        vendas_previstas = CACHE_PREVISOES[chave][1]
+        return vendas_previstas[:horizonte] if len(vendas_previstas) >= horizonte else None
+
+    linha = conexao(somente_leitura=True).execute(CONSULTA_PREVISAO_CACHE, (*chave, impressao)).fetchone()
+
+    if linha is None or linha[0] < horizonte:
+        return None
+    vendas_previstas = np.frombuffer(linha[1], dtype=np.float64)
+    guardar_previsao_memoria(chave, impressao, vendas_previstas)
+    return vendas_previstas[:horizonte]
+
+# Com o cache válido mas 'horizonte' diferente do gravado em 'previsão_futura', refaz as linhas diárias do par
+# a partir dos coeficientes. Retorna False se o par não tem coeficientes (a previsão precisa ser ajustada)
+def regravar_horizonte_par(sku, conta, horizonte, materializar=None):
+    if materializar is None:
+        materializar = MATERIALIZAR_PREVISOES
+    if not materializar:
+        return True
+
+    with conexao() as conn:
+        if conn.execute(CONTAR_PREVISAO_PAR, (sku, conta)).fetchone()[0] == horizonte:
+            return True
+        coeficientes = ler_coeficientes(conn, sku, conta)
+        if coeficientes.empty:
+            return False
+        conn.execute(APAGAR_PREVISAO_PAR, (sku, conta))
+        gravar_em_lote('previsão_futura', calcular_previsoes(coeficientes, horizonte), COLUNAS_PREVISAO,
+                       conn=conn, confirmar=False)
+    return True
+
+# Faz a previsão das vendas para 'horizonte' dias, usando uma funsão linear quadratica.
+# Se o histórico do SKU não mudou desde a última vez, a previsão vem do cache, sem reajustar nem regravar
+def comparacao_previsao_vendas(sku_desejado, conta_desejada=None, retornar_dados=False, horizonte=HORIZONTE_PADRAO, materializar=None):  
+    # Sem conta, a previsão é a geral: as contas são somadas por dia no SQLite e a série é ajustada uma vez
+    vendas = ler_vendas_densas(sku_desejado, conta_desejada) if conta_desejada else ler_vendas_geral(sku_desejado)
 
-    # Salvar previsões no banco - primeiro apagar previsões antigas para esse sku e conta
-    conn = sqlite3.connect(BANCO_DE_DADOS)
-    cursor = conn.cursor()
+    if vendas.empty:
+        print(f"Não há dados suficientes para SKU '{sku_desejado}'" + (f" e conta '{conta_desejada}'." if conta_desejada else "."))
+        return (None, None, None) if retornar_dados else None
 
-    # Apagar previsões antigas para os SKUs e contas presentes na nova previsão
-    for (conta, sku) in df_previsao[['conta', 'sku']].drop_duplicates().values:
-        cursor.execute("""
-            DELETE FROM previsão_futura WHERE sku = ? AND conta = ?
-        """, (sku, conta))
+    chave = (sku_desejado, conta_desejada or '')
+    impressao = impressao_vendas(vendas)
+    vendas_previstas = buscar_previsao_cache(chave, impressao, horizonte)
+    if vendas_previstas is not None and conta_desejada and not regravar_horizonte_par(*chave, horizonte, materializar):
+        vendas_previstas = None
 
-    # Inserir novas previsões
-    for _, row in df_previsao.iterrows():
-        cursor.execute("""
-            INSERT INTO previsão_futura (sku, data, quantidade_prevista, conta)
-            VALUES (?, ?, ?, ?)
-        """, (row['sku'], row['data'], row['quantidade_prevista'], row['conta']))
+    if vendas_previstas is not None:
+        print(f"Previsão do SKU '{sku_desejado}' reaproveitada (histórico sem mudanças).")
+        if retornar_dados:
+            # Mesmo retorno do ajuste: a série do par (conta, sku) ou a série geral
+            return vendas.copy(), vendas_previstas, sku_desejado
+        return None
 
-    conn.commit()
-    conn.close()
+    if conta_desejada:
+        grupo, vendas_previstas, df_previsao, df_coeficientes = ajustar_previsao(vendas, horizonte)
+    else:
+        grupo = vendas
+        _, vendas_previstas, _ = ajustar_serie(vendas[['data', 'quantidade']], horizonte)
+
+    # Salvar previsões no banco e guardar no cache na mesma transação (desfeita se algo falhar).
+    # A previsão geral fica só no cache (conta ''); a de cada conta não é tocada. O cache guarda uma linha por par
+    vendas_previstas = np.ascontiguousarray(vendas_previstas, dtype=np.float64)
+    with conexao() as conn:
+        if conta_desejada:
+            # Troca as previsões antigas do SKU e conta
+            gravar_previsoes_pares(conn, df_coeficientes[['sku', 'conta']].values.tolist(), df_previsao, df_coeficientes, materializar)
+        conn.execute(APAGAR_CACHE_PAR, chave)
+        conn.execute(GRAVAR_PREVISAO_CACHE, (*chave, horizonte, impressao, vendas_previstas.tobytes(), data()))
+    guardar_previsao_memoria(chave, impressao, vendas_previstas)
 
     if retornar_dados:
         return grupo, vendas_previstas, sku_desejado
 
-# Toda vez que há novos dados a tabela de previsão futura precisa ser atualizada com as novas informações para mais precisão
-def gerar_todas_previsoes():
-    with sqlite3.connect(BANCO_DE_DADOS) as conn:
+# Faz a previsão de todos os pares (sku, conta) de uma só vez, mesma função quadrática da previsão por SKU
+# Com 'skus' só esses SKUs são recalculados e o restante de previsão_futura fica como está
+def previsao_vendas_em_lote(horizonte=HORIZONTE_PADRAO, skus=None, materializar=None):
+    if materializar is None:
+        materializar = MATERIALIZAR_PREVISOES
+
+    conn = conectar_escrita()
+    try:
+        data_inicio_global, data_fim_global = intervalo_vendas(conn)
+        if skus is not None:
+            conn.execute(TABELAS_TEMPORARIAS['skus_alvo'])
+            conn.execute("DELETE FROM skus_alvo")
+            conn.executemany("INSERT OR IGNORE INTO skus_alvo VALUES (?)", [(sku,) for sku in skus])
+
+        # Cada par (conta, sku) recebe um número, na mesma ordem do groupby(['contas', 'sku'])
+        conn.execute(TABELAS_TEMPORARIAS['pares_lote'])
+        conn.execute("DELETE FROM pares_lote")
+        conn.execute(CONSULTA_NUMERAR_PARES.format('' if skus is None else FILTRO_SKUS_ALVO))
+        pares = pd.read_sql_query("SELECT contas, sku FROM pares_lote ORDER BY par", conn)
+
+        if pares.empty:
+            print("Não há vendas para gerar previsões.")
+            return None
+
+        # Só números saem do banco: o par, o dia (inteiro, contado do início do intervalo global) e a quantidade.
+        # Lido em blocos para a lista de linhas do sqlite3 nunca ter a tabela inteira
+        with etapa('previsao.leitura') as registro:
+            blocos = pd.read_sql_query(CONSULTA_VENDAS_LOTE, conn, params=(data_inicio_global.strftime('%Y-%m-%d'),), chunksize=TAMANHO_LOTE)
+            vendas = pd.concat([tipos_compactos(bloco) for bloco in blocos], ignore_index=True)
+            registro['linhas'] = len(vendas)
+        par = vendas['par'].to_numpy()
+        quantidade = pd.to_numeric(vendas['quantidade'], errors='coerce').fillna(0).to_numpy(dtype=float)
+
+        # Como na leitura densificada, todo par vai do início ao fim do intervalo global da tabela
+        pares['min'], pares['max'] = data_inicio_global, data_fim_global
+        n_pares = len(pares)
+
+        # Início e tamanho da série diária de cada par (dias sem venda contam como zero)
+        inicio = (pares['min'] - data_inicio_global).dt.days.to_numpy().astype(float)
+        fim = (pares['max'] - data_inicio_global).dt.days.to_numpy()
+        n = fim - inicio + 1
+
+        # Somas de y, j*y e j²*y por par com j = dia global, direto das vendas (sem a matriz pares x dias);
+        # fora da série de cada par y é zero
+        j = vendas['dia'].to_numpy(dtype=float)
+        Sy, Sjy, Sj2y = (np.bincount(par, weights=quantidade * j ** k, minlength=n_pares) for k in range(3))
+
+        # Passa para t = j - inicio (t começa em zero em cada par, igual à previsão por SKU)
+        Sty = Sjy - inicio * Sy
+        St2y = Sj2y - 2 * inicio * Sjy + inicio ** 2 * Sy
+
+        # Somas de potências de t = 0..n-1 em forma fechada
+        m = n - 1
+        S1 = m * n / 2
+        S2 = m * n * (2 * m + 1) / 6
+        S3 = S1 ** 2
+        S4 = m * n * (2 * m + 1) * (3 * m ** 2 + 3 * m - 1) / 30
+
+        # Equações normais centradas (o intercepto não entra na matriz, como no LinearRegression)
+        t_media, t2_media, y_media = S1 / n, S2 / n, Sy / n
+        A = np.empty((n_pares, 2, 2))
+        A[:, 0, 0] = S2 - n * t_media ** 2
+        A[:, 0, 1] = A[:, 1, 0] = S3 - n * t_media * t2_media
+        A[:, 1, 1] = S4 - n * t2_media ** 2
+        b = np.column_stack([Sty - n * t_media * y_media, St2y - n * t2_media * y_media])
+
+        # pinv dá a solução de norma mínima para séries com um ou dois dias, igual ao lstsq
+        coef = (np.linalg.pinv(A) @ b[:, :, None])[:, :, 0]
+        intercepto = y_media - coef[:, 0] * t_media - coef[:, 1] * t2_media
+
+        # t = 0 é o início da série de cada par; os valores diários saem de calcular_previsoes
+        df_coeficientes = pd.DataFrame({
+            'sku': pares['sku'], 'conta': pares['contas'],
+            'intercepto': intercepto, 'coef_t': coef[:, 0], 'coef_t2': coef[:, 1],
+            'data_origem': pares['min'].dt.strftime('%Y-%m-%d'), 'ultima_data': pares['max'].dt.strftime('%Y-%m-%d'),
+        })
+
+        # Substitui as previsões numa única transação
+        with etapa('previsao.gravacao', linhas=n_pares * horizonte if materializar else n_pares):
+            # O cache das previsões dos SKUs refeitos deixa de valer junto com os coeficientes
+            for tabela in ('previsão_futura', 'coeficientes_previsao', 'cache_previsoes'):
+                if skus is None:
+                    conn.execute(f"DELETE FROM {tabela}")
+                else:
+                    conn.execute(APAGAR_PREVISOES_SKUS_ALVO.format(tabela))
+            descartar_previsoes_memoria(None if skus is None else set(skus))
+            if materializar:
+                # As linhas diárias são montadas em blocos de pares, sem a tabela de todos os pares x dias na memória
+                pares_por_bloco = max(1, TAMANHO_LOTE // max(horizonte, 1))
+                for i in range(0, n_pares, pares_por_bloco):
+                    gravar_em_lote('previsão_futura', calcular_previsoes(df_coeficientes.iloc[i:i + pares_por_bloco], horizonte),
+                                   conn=conn, tamanho_lote=None, confirmar=False)
+            gravar_em_lote('coeficientes_previsao', df_coeficientes, conn=conn, tamanho_lote=None)
+    except Exception:
+        # Desfaz os DELETEs e gravações feitos pela metade antes de fechar a conexão
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    print(f"Previsões geradas para {n_pares} pares (sku, conta).")
+    return n_pares
+
+# Ajusta o modelo SKU por SKU para uma lista de pares (sku, conta); roda dentro dos processos da previsão
+def prever_pares(pares, horizonte=HORIZONTE_PADRAO):
+    previsoes, coeficientes = [], []
+    with etapa('previsao.tarefa', linhas=len(pares)):
+        for sku, conta in pares:
+            vendas = ler_vendas_densas(sku, conta)
+            if vendas.empty:
+                continue
+            _, _, df_previsao, df_coeficientes = ajustar_previsao(vendas, horizonte)
+            previsoes.append(df_previsao)
+            coeficientes.append(df_coeficientes)
+    if not previsoes:
+        return pares, None, None
+    return pares, pd.concat(previsoes, ignore_index=True), pd.concat(coeficientes, ignore_index=True)
+
+# Previsão SKU por SKU (uma LinearRegression por par) dividida em tarefas de PARES_POR_TAREFA pares entre 'workers'
+# processos. Cada resultado é gravado assim que fica pronto, e só este processo grava no banco
+def previsao_vendas_por_sku(skus=None, workers=None, horizonte=HORIZONTE_PADRAO, materializar=None):
+    vendas = pd.read_sql_query(CONSULTA_PARES_VENDAS, conexao(somente_leitura=True))
+
+    if skus is not None:
+        vendas = vendas[vendas['sku'].isin(set(skus))]
+
+    pares = list(vendas[['sku', 'contas']].itertuples(index=False, name=None))
+    tarefas = [(pares[i:i + PARES_POR_TAREFA], horizonte) for i in range(0, len(pares), PARES_POR_TAREFA)]
+
+    conn = conectar_escrita()
+    if skus is None:
         conn.execute("DELETE FROM previsão_futura")
+        conn.execute("DELETE FROM coeficientes_previsao")
         conn.commit()
-        print("Dados antigos apagados da tabela 'previsão_futura'.")
-        vendas = pd.read_sql_query("SELECT DISTINCT sku, contas FROM vendas", conn)
+        print("Dados antigos apagados das tabelas 'previsão_futura' e 'coeficientes_previsao'.")
+
+    feitos = 0
+    try:
+        for pares_feitos, df_previsao, df_coeficientes in resultados_em_paralelo(prever_pares, tarefas, workers):
+            # Apagar previsões antigas dos pares recalculados e inserir as novas na mesma transação
+            with etapa('previsao.gravacao', linhas=len(pares_feitos)):
+                gravar_previsoes_pares(conn, pares_feitos, df_previsao, df_coeficientes, materializar)
+                conn.commit()
+
+            feitos += len(pares_feitos)
+            print(f"Previsões: {feitos}/{len(pares)} pares ({feitos / len(pares):.0%})")
+    finally:
+        conn.close()
+
+    return len(pares)
+
+# Mede a previsão SKU por SKU com 1 até N processos (regrava 'previsão_futura' a cada rodada)
+def benchmark_previsoes(lista_workers=None, skus=None):
+    lista_workers = lista_workers or sorted({1, 2, 4, PROCESSOS_LEITURA})
+    tempos = {}
+    for workers in lista_workers:
+        inicio = time.perf_counter()
+        n_pares = previsao_vendas_por_sku(skus=skus, workers=workers)
+        tempos[workers] = time.perf_counter() - inicio
+
+    for workers, tempo in tempos.items():
+        print(f"{workers:>3} processo(s): {tempo:8.2f} s | {n_pares / tempo:10,.1f} pares/s | "
+              f"ganho {tempos[lista_workers[0]] / tempo:.1f}x")
+    return tempos
+
+# Mede a previsão de 'amostra' pares (sku, conta) com comparacao_previsao_vendas (a das opções do menu e do
+# forecast-sku) abrindo uma conexão por leitura, como antes, e com as conexões da sessão. Roda sobre uma cópia do
+# banco. Em cada repetição o cache das previsões é apagado: a passada 'fria' ajusta e grava cada par, e a 'quente'
+# só confere o histórico e lê a previsão da tabela 'cache_previsoes'. Retorna os pares/s por (reusar, passada)
+def benchmark_conexoes(amostra=50, repeticoes=3):
+    global REUSAR_CONEXOES
+    banco_original, reusar_original = BANCO_DE_DADOS, REUSAR_CONEXOES
+    tempos = {}
+
+    with tempfile.TemporaryDirectory() as temporaria:
+        copia = os.path.join(temporaria, os.path.basename(BANCO_DE_DADOS))
+        with sqlite3.connect(BANCO_DE_DADOS) as origem, sqlite3.connect(copia) as destino:
+            origem.backup(destino)
+        origem.close()
+        destino.close()
 
-    for _, row in vendas.iterrows():
-        sku = row['sku']
-        conta = row['contas']
-        comparacao_previsao_vendas(sku, conta)
+        try:
+            definir_banco(copia)
+            pares = conexao(somente_leitura=True).execute(
+                "SELECT DISTINCT sku, contas FROM vendas WHERE contas IS NOT NULL ORDER BY sku, contas LIMIT ?",
+                (amostra,)).fetchall()
+            if not pares:
+                print("Não há vendas para medir as previsões.")
+                return None
+
+            with redirect_stdout(io.StringIO()):
+                # Fora da medida: a primeira previsão ainda importa o sklearn
+                comparacao_previsao_vendas(*pares[0])
+                for reusar in (False, True):
+                    REUSAR_CONEXOES = reusar
+                    for _ in range(repeticoes):
+                        fechar_conexoes()
+                        with conexao() as conn:
+                            conn.execute("DELETE FROM cache_previsoes")
+                        for passada in ('fria', 'quente'):
+                            CACHE_PREVISOES.clear()
+                            inicio = time.perf_counter()
+                            for sku, conta in pares:
+                                comparacao_previsao_vendas(sku, conta)
+                            tempos.setdefault((reusar, passada), []).append(time.perf_counter() - inicio)
+        finally:
+            REUSAR_CONEXOES = reusar_original
+            definir_banco(banco_original)
+
+    vazao = {chave: len(pares) / float(np.median(medidas)) for chave, medidas in tempos.items()}
+    print(f"Previsões de {len(pares)} pares (mediana de {repeticoes} repetição(ões)):")
+    for passada in ('fria', 'quente'):
+        print(f"{passada:>7}: {vazao[False, passada]:8.1f} pares/s abrindo conexões | "
+              f"{vazao[True, passada]:8.1f} pares/s com as da sessão | ganho {vazao[True, passada] / vazao[False, passada]:.2f}x")
+    return vazao
+
+# Toda vez que há novos dados a tabela de previsão futura precisa ser atualizada com as novas informações para mais precisão
+@medido('previsao')
+def gerar_todas_previsoes(em_lote=True, skus=None, workers=None, horizonte=HORIZONTE_PADRAO, materializar=None):
+    # 'skus' vem da atualização incremental: só os SKUs com histórico alterado são recalculados
+    if skus is not None and not skus:
+        print("Nenhum SKU com vendas alteradas, previsões mantidas.")
+        return
+
+    # Em lote todos os pares são ajustados juntos; em_lote=False mantém o ajuste SKU por SKU, em 'workers' processos
+    if em_lote:
+        previsao_vendas_em_lote(horizonte=horizonte, skus=skus, materializar=materializar)
+    else:
+        previsao_vendas_por_sku(skus=skus, workers=workers, horizonte=horizonte, materializar=materializar)
 
 # Faz a previsão do estoque, com base nas previsões futuras já existentes
-def previsao_estoque(sku_desejado, retornar_dados=False):  
-    conn = sqlite3.connect(BANCO_DE_DADOS)
+def previsao_estoque(sku_desejado, retornar_dados=False, horizonte=HORIZONTE_PADRAO):  
+    conn = conexao(somente_leitura=True)
 
-    # Dados históricos
-    estoque = pd.read_sql_query(
-        "SELECT sku, data, quantidade_estoque FROM estoque WHERE sku = ?",
-        conn, params=(sku_desejado,))
+    # Estoque atual: sempre da carga em 'estoque', como em projetar_estoque_em_lote (o mais recente primeiro)
+    estoque = pd.read_sql_query(CONSULTA_ESTOQUE_SKU, conn, params=(sku_desejado,))
+
+    # O histórico das cargas só entra no gráfico; as datas da carga atual valem pela carga atual
+    # (a carga pode ter sido feita sem guardar o histórico)
+    historico = pd.read_sql_query(CONSULTA_HISTORICO_ESTOQUE_SKU, conn, params=(sku_desejado,))
+    historico = historico[~historico['data'].isin(set(estoque['data']))].copy()
+    historico['data'] = pd.to_datetime(historico['data'])
     estoque['data'] = pd.to_datetime(estoque['data'])
 
     # Previsão futura de vendas
-    pv = pd.read_sql_query(
-        "SELECT sku, data, quantidade_prevista FROM previsão_futura WHERE sku = ? ORDER BY data",
-        conn, params=(sku_desejado,))
+    pv = ler_previsoes(conn, sku_desejado, horizonte=horizonte)
     pv['data'] = pd.to_datetime(pv['data'])
 
-    conn.close()
-
     if estoque.empty or not estoque['sku'].isin({sku_desejado}).any():
         print(f"Não há dados suficientes para SKU '{sku_desejado} ou ela não existe no estoque!'")
-        return (None, None) if retornar_dados else None
+        return (None, None, None) if retornar_dados else None
+
+    # Sem previsão de vendas não há o que descontar do estoque
+    if pv.empty:
+        print(f"Não há previsão de vendas para o SKU '{sku_desejado}', gere as previsões antes (opção 1)!")
+        return (None, None, None) if retornar_dados else None
 
     # Último estoque registrado
     ultima_data = pv['data'].min()
     estoque_atual = estoque['quantidade_estoque'].values[0]
 
     # Criar vetor de datas futuras
-    datas_futuras = pd.date_range(start=ultima_data + pd.Timedelta(days=1), periods=360)
+    datas_futuras = pd.date_range(start=ultima_data + pd.Timedelta(days=1), periods=horizonte)
 
     # Criar Series com vendas previstas (indexadas por data)
     pv = pv.groupby('data', as_index=False)['quantidade_prevista'].sum()
     vendas_previstas = pv.set_index('data')['quantidade_prevista'].reindex(datas_futuras, fill_value=0.0)
 
     # Calcular estoque dia a dia
-    estoque_previsto = []
-    for venda in vendas_previstas:
-        if estoque_atual - venda >= 0:
-            estoque_atual = estoque_atual - venda
-        else:
-            estoque_atual = 0
-        estoque_previsto.append(estoque_atual)
+    estoque_previsto = projetar_estoque(estoque_atual, vendas_previstas)
 
-    # Agrupar histórico para o retorno
-    grupo = estoque.groupby('data')['quantidade_estoque'].sum().reset_index()
-    grupo = grupo.set_index('data').asfreq('D', fill_value=0.0).reset_index()
+    # Agrupar histórico para o retorno; dias sem carga repetem o estoque da carga anterior
+    grupo = pd.concat([estoque, historico], ignore_index=True).groupby('data')['quantidade_estoque'].sum().reset_index()
+    grupo = grupo.set_index('data').asfreq('D').ffill().reset_index()
 
     if retornar_dados:
         return grupo, estoque_previsto, sku_desejado
 
-# Traz os arquivos do estoque
-def g_arquivos_estoque():
-    lista_estoque = []
-    
+# Lista os arquivos CSV de estoque de cada conta (ignorando os 'full')
+def listar_arquivos_estoque():
+    arquivos = []
+
     for nome_conta in CONTAS.values():
         conta = ''.join(nome_conta.split())  # Remove espaços
         caminho_conta = os.path.join(PASTA_ESTOQUE, conta)
@@ -324,7 +1645,7 @@ def g_arquivos_estoque():
             print(f"Pasta não encontrada: {caminho_conta}")
             continue
 
-        for nome_arquivo in os.listdir(caminho_conta):
+        for nome_arquivo in sorted(os.listdir(caminho_conta)):
             caminho_arquivo = os.path.join(caminho_conta, nome_arquivo)
 
             if nome_arquivo.__contains__('full'):
@@ -332,177 +1653,1022 @@ def g_arquivos_estoque():
 
             # Verifica se é um arquivo CSV
             if os.path.isfile(caminho_arquivo) and nome_arquivo.endswith('.csv'):
-                try:
-                    df = pd.read_csv(caminho_arquivo,  sep=';', on_bad_lines='skip')
-                    print(f"Arquivo lido com sucesso: {caminho_arquivo}")
-                    if 'Código' in df.columns:
-                        df.rename(columns={'Código': 'SKU'}, inplace=True)
-                        df['SKU'] = df['SKU'].str.split(' ').explode('SKU')
-                        #trata o sku e adiciona ele a df
-                        df[['quantidade_itens', 'sku']] = df['SKU'].apply(lambda x: pd.Series(tratar_SKU(x)))
-                        df['quantidade_itens'] = pd.to_numeric(df['quantidade_itens'], errors='coerce').fillna(0).astype(int)
-                        # PEGA A COLUNA DE ESTOQUE
-                        df['quantidade_estoque'] = df['Estoque']
-                        df['quantidade_estoque'] = df['quantidade_estoque'].astype(str).str.replace(',', '.', regex=False).str.strip()
-                        df['quantidade_estoque'] = pd.to_numeric(df['quantidade_estoque'], errors='coerce').fillna(0.0).astype(float)
-                        df['data'] = str(data())
-                        # só da um append nas colunas nessessárias
-                        lista_estoque.append(df[['sku', 'quantidade_itens', 'quantidade_estoque', 'data']])
-                        df_all = pd.concat(lista_estoque, ignore_index=False)
-                        df_all = df_all.groupby(['sku']).agg({
-                            'quantidade_estoque' : 'sum'
-                        
-                        }).reset_index()
-
-                except Exception as e:
-                    print(f"Erro ao ler {caminho_arquivo}: {e}")
-
-    if lista_estoque:
-        df_all = pd.concat(lista_estoque, ignore_index=False)
-        df_all = df_all.groupby(['sku', 'data']).agg({
-            'quantidade_estoque' : 'sum',
-            'quantidade_itens' : 'sum'                        
-        }).reset_index()
-
-        # conexão com o banco de dados para enviar para a tabela 'estoque'
-        with sqlite3.connect(BANCO_DE_DADOS) as conn:
-            cursor = conn.cursor()
-            for _, row in df_all.iterrows():
-                cursor.execute("""
-                    INSERT INTO estoque (sku, 'quantidade_itens', 'quantidade_estoque', 'data')
-                    VALUES (?, ?, ?, ?)
-                """, (row['sku'], row['quantidade_itens'], row['quantidade_estoque'], row['data']))
+                arquivos.append(caminho_arquivo)
+
+    return arquivos
+
+# Normaliza um bloco de um CSV de estoque e soma por SKU (quantidade_itens, quantidade_estoque)
+def agregar_bloco_estoque(bloco):
+    # Um código pode ter vários SKUs separados por espaço: cada um vira uma linha com o estoque da linha original
+    varios = bloco['Código'].str.contains(' ', regex=False, na=False)
+    if varios.any():
+        bloco = bloco.assign(SKU=bloco['Código'].str.split(' ')).explode('SKU', ignore_index=True)
+    else:
+        bloco = bloco.assign(SKU=bloco['Código'])
+
+    #trata o sku e adiciona ele ao bloco
+    bloco[['quantidade_itens', 'sku']] = tratar_SKU_coluna(bloco['SKU'])
+    bloco['quantidade_itens'] = pd.to_numeric(bloco['quantidade_itens'], errors='coerce').fillna(0).astype(np.int64)
+
+    # PEGA A COLUNA DE ESTOQUE (decimal com vírgula)
+    estoque = bloco['Estoque'].str.replace(',', '.', regex=False).str.strip()
+    bloco['quantidade_estoque'] = pd.to_numeric(estoque, errors='coerce').fillna(0.0).astype(float)
+
+    return bloco.groupby('sku')[['quantidade_estoque', 'quantidade_itens']].sum()
+
+# Lê um arquivo de estoque em blocos de TAMANHO_BLOCO_ESTOQUE linhas, só com as colunas usadas (como texto),
+# somando cada bloco no total por SKU. Devolve sku, quantidade_itens, quantidade_estoque, data
+def ler_arquivo_estoque(caminho_arquivo, tamanho_bloco=None):
+    with etapa('estoque.arquivo', arquivo=caminho_arquivo) as registro:
+        registro['linhas'] = 0
+        try:
+            blocos = pd.read_csv(caminho_arquivo, sep=';', on_bad_lines='skip', usecols=lambda coluna: coluna in ('Código', 'Estoque'),
+                                 dtype=str, chunksize=tamanho_bloco or TAMANHO_BLOCO_ESTOQUE)
+            total = None
+            for bloco in blocos:
+                if 'Código' not in bloco.columns:
+                    break
+                if 'Estoque' not in bloco.columns:
+                    raise KeyError("coluna 'Estoque' não encontrada")
+                registro['linhas'] += len(bloco)
+                agregado = agregar_bloco_estoque(bloco)
+                total = agregado if total is None else total.add(agregado, fill_value=0)
+
+            print(f"Arquivo lido com sucesso: {caminho_arquivo}")
+            if total is not None:
+                total = total.reset_index()
+                total['quantidade_itens'] = total['quantidade_itens'].astype(np.int64)
+                total['data'] = str(data())
+                # só devolve as colunas nessessárias
+                return total[['sku', 'quantidade_itens', 'quantidade_estoque', 'data']]
+
+        except Exception as e:
+            print(f"Erro ao ler {caminho_arquivo}: {e}")
+
+    return None
+
+# Estoque projetado dia a dia: desconta as vendas previstas acumuladas e para em zero.
+# Serve para uma série (um SKU) ou para uma matriz SKU x dias
+def projetar_estoque(estoque_atual, vendas_previstas):
+    vendas_previstas = np.asarray(vendas_previstas, dtype=float)
+    estoque_atual = np.asarray(estoque_atual, dtype=float)[..., None]
+    return np.fmax(estoque_atual - np.cumsum(vendas_previstas, axis=-1), 0)
+
+# Primeiro dia (1 = primeiro dia projetado) em que cada linha de 'abaixo' é verdadeira; 0 se já começa abaixo
+# do limite e NaN se não chega nele dentro do horizonte
+def primeiro_dia_abaixo(abaixo, ja_abaixo):
+    dias = np.where(abaixo.any(axis=1), abaixo.argmax(axis=1) + 1, np.nan)
+    return np.where(ja_abaixo, 0, dias)
+
+# Projeção do estoque de todos os SKUs de uma vez (mesmas regras de previsao_estoque), lendo 'estoque' e
+# 'previsão_futura' uma única vez. Retorna uma tabela por SKU com a data de ruptura (estoque zerado) e o
+# ponto de pedido (demanda média prevista durante o prazo de reposição); com retornar_curvas=True
+# devolve também a matriz SKU x dias do estoque projetado
+@medido('estoque.projecao')
+def projetar_estoque_em_lote(horizonte=HORIZONTE_PADRAO, skus=None, prazo_reposicao=PRAZO_REPOSICAO_DIAS, retornar_curvas=False):
+    conn = conexao(somente_leitura=True)
+    estoque = pd.read_sql_query(CONSULTA_ESTOQUE, conn)
+    coeficientes = ler_coeficientes(conn)
+    gravadas = ler_previsoes_gravadas(conn, horizonte=horizonte)
+
+    # Estoque mais recente de cada SKU
+    estoque = estoque.dropna(subset=['sku']).drop_duplicates('sku').reset_index(drop=True)
+    if skus is not None:
+        estoque = estoque[estoque['sku'].isin(set(skus))].reset_index(drop=True)
+    coeficientes = coeficientes[coeficientes['sku'].isin(estoque['sku'])]
+    gravadas = gravadas[gravadas['sku'].isin(estoque['sku'])]
+
+    # Previsão de todos os pares como arrays (linha do SKU, dia, quantidade): os pares com coeficientes saem da
+    # matriz pares x dias, sem a tabela longa de ler_previsoes com textos em cada linha. Dias contados desde 1970
+    n_skus = len(estoque)
+    indice_skus = pd.Index(estoque['sku'])
+    datas, previstos = matriz_previsoes(coeficientes, horizonte)
+    linha = np.concatenate([np.repeat(indice_skus.get_indexer(coeficientes['sku']), horizonte),
+                            indice_skus.get_indexer(gravadas['sku'])])
+    dia_previsto = np.concatenate([datas.ravel().astype(np.int64),
+                                   pd.to_datetime(gravadas['data']).to_numpy().astype('datetime64[D]').astype(np.int64)])
+    quantidade = np.concatenate([previstos.ravel(), gravadas['quantidade_prevista'].to_numpy(dtype=float)])
+
+    # Como em previsao_estoque, a projeção começa no dia seguinte à primeira data prevista do SKU
+    inicio_sku = pd.Series(dia_previsto).groupby(linha).min().reindex(range(n_skus)).to_numpy()
+    dia = dia_previsto - inicio_sku[linha]
+    valido = (dia >= 1) & (dia <= horizonte)
+
+    vendas_previstas = np.bincount(
+        linha[valido] * horizonte + dia[valido].astype(np.int64) - 1,
+        weights=quantidade[valido],
+        minlength=n_skus * horizonte).reshape(n_skus, horizonte)
+
+    estoque_atual = estoque['quantidade_estoque'].to_numpy(dtype=float)
+    curvas = projetar_estoque(estoque_atual, vendas_previstas)
+
+    demanda_media = vendas_previstas.mean(axis=1) if horizonte else np.zeros(n_skus)
+    ponto_de_pedido = demanda_media * prazo_reposicao
+    dias_ate_ruptura = primeiro_dia_abaixo(curvas <= 0, estoque_atual <= 0)
+    dias_ate_pedido = primeiro_dia_abaixo(curvas <= ponto_de_pedido[:, None], estoque_atual <= ponto_de_pedido)
+
+    inicio = pd.Series(pd.to_datetime(inicio_sku, unit='D'))
+    tabela = pd.DataFrame({
+        'sku': estoque['sku'],
+        'estoque_atual': estoque_atual,
+        'demanda_prevista': vendas_previstas.sum(axis=1),
+        'demanda_media_diaria': demanda_media,
+        'ponto_de_pedido': ponto_de_pedido,
+        'dias_ate_pedido': dias_ate_pedido,
+        'data_pedido': inicio + pd.to_timedelta(dias_ate_pedido, unit='D'),
+        'dias_ate_ruptura': dias_ate_ruptura,
+        'data_ruptura': inicio + pd.to_timedelta(dias_ate_ruptura, unit='D'),
+        'estoque_final': curvas[:, -1] if horizonte else estoque_atual,
+    })
+
+    if retornar_curvas:
+        return tabela, curvas
+    return tabela
+
+# Relatório (sem interação) dos SKUs que ficam sem estoque nos próximos 'dias', do mais urgente para o menos,
+# com a quantidade sugerida de pedido. Gravado em PASTA_SAIDA como CSV ou Parquet; retorna o caminho do arquivo
+def relatorio_ruptura(dias=30, formato='csv', horizonte=HORIZONTE_PADRAO, prazo_reposicao=PRAZO_REPOSICAO_DIAS, cobertura=DIAS_COBERTURA):
+    tabela = projetar_estoque_em_lote(horizonte=horizonte, prazo_reposicao=prazo_reposicao)
+
+    relatorio = tabela[tabela['dias_ate_ruptura'] <= dias].copy()
+
+    # Pedido sugerido: demanda prevista durante o prazo de reposição mais a cobertura, menos o estoque atual
+    necessidade = relatorio['demanda_media_diaria'] * (prazo_reposicao + cobertura) - relatorio['estoque_atual'].clip(lower=0)
+    relatorio['quantidade_sugerida'] = np.ceil(necessidade.clip(lower=0)).astype(int)
+
+    relatorio = relatorio.sort_values(['dias_ate_ruptura', 'demanda_media_diaria'], ascending=[True, False])
+    relatorio.insert(0, 'posicao', np.arange(1, len(relatorio) + 1))
+    relatorio = relatorio.round(2)
+    for coluna in ('data_pedido', 'data_ruptura'):
+        relatorio[coluna] = relatorio[coluna].dt.strftime('%Y-%m-%d')
+
+    os.makedirs(PASTA_SAIDA, exist_ok=True)
+    nome = f"ruptura_{dias}_dias_{data()}"
+    if formato == 'parquet':
+        caminho = os.path.join(PASTA_SAIDA, nome + '.parquet')
+        relatorio.to_parquet(caminho, index=False)
+    else:
+        caminho = os.path.join(PASTA_SAIDA, nome + '.csv')
+        relatorio.to_csv(caminho, sep=';', decimal=',', index=False)
+
+    print(f"Relatório de ruptura gravado em {caminho}: {len(relatorio)} de {len(tabela)} SKUs ficam sem estoque em até {dias} dias.")
+    return caminho
+
+# Troca o conteúdo de 'estoque' pela nova carga (sku, quantidade_itens, quantidade_estoque, data) numa única
+# transação: a carga vai primeiro para uma tabela temporária e só então substitui a atual, então quem lê o banco
+# vê o estoque antigo ou o novo, nunca a tabela vazia. A tabela e os índices não são recriados. Com
+# manter_historico (padrão MANTER_HISTORICO_ESTOQUE) a carga também substitui a partição da sua data em 'estoque_historico'
+def trocar_estoque(df, manter_historico=None):
+    if manter_historico is None:
+        manter_historico = MANTER_HISTORICO_ESTOQUE
+    colunas = 'sku, quantidade_itens, quantidade_estoque, data'
+
+    conn = conectar_escrita()
+    try:
+        conn.execute(TABELAS_TEMPORARIAS['estoque_novo'])
+        conn.execute("DELETE FROM estoque_novo")
+        with etapa('estoque.gravacao', linhas=len(df)):
+            gravar_em_lote('estoque_novo', df, colunas.split(', '), conn=conn, confirmar=False)
+
+            conn.execute("DELETE FROM estoque")
+            conn.execute(f"INSERT INTO estoque ({colunas}) SELECT {colunas} FROM estoque_novo")
+            if manter_historico:
+                conn.execute(APAGAR_HISTORICO_DA_CARGA)
+                conn.execute(f"INSERT OR REPLACE INTO estoque_historico ({colunas}) SELECT {colunas} FROM estoque_novo WHERE sku IS NOT NULL")
             conn.commit()
-            print("Dados inseridos com sucesso no banco.") 
-            banco_existe({'estoque': df_all})
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    print(f"Tabela 'estoque' trocada pela nova carga ({len(df)} SKUs)" + (" e guardada no histórico." if manter_historico else "."))
+
+# Traz os arquivos do estoque, lidos em 'workers' processos. Cada arquivo já chega somado por SKU
+# e é somado no total corrente, sem juntar as linhas de todos os arquivos
+@medido('estoque')
+def g_arquivos_estoque(workers=None, manter_historico=None):
+    # Resultados na ordem de listar_arquivos_estoque, então a soma não depende do paralelismo
+    resultados = executar_em_paralelo(ler_arquivo_estoque, [(caminho,) for caminho in listar_arquivos_estoque()], workers)
+
+    total = None
+    for df in resultados:
+        if df is None:
+            continue
+        df = df.set_index(['sku', 'data'])[['quantidade_estoque', 'quantidade_itens']]
+        total = df if total is None else total.add(df, fill_value=0)
 
-# Traz os arquivos das vendas
-def g_arquivos_vendas(): 
-    file_list = []
+    if total is not None:
+        df_all = total.sort_index().reset_index()
+        df_all['quantidade_itens'] = df_all['quantidade_itens'].astype(np.int64)
+
+        # Carga gravada uma vez só, substituindo o estoque anterior
+        trocar_estoque(df_all, manter_historico)
+
+# Lista os arquivos de vendas relevantes de cada conta, como (conta, caminho)
+def listar_arquivos_vendas():
+    arquivos = []
 
     # Separar os nomes das contas para direcionar caminho                                 
     for contas in CONTAS.values():
         contas = contas.split()
         contas = ''.join(contas)  # converte lista para string
         CAMINHO_SUB_VENDAS = os.path.join(PASTA_VENDAS, contas)  # caminho para as sub_pastas
-        
+
+        if not os.path.isdir(CAMINHO_SUB_VENDAS):
+            print(f"Pasta não encontrada: {CAMINHO_SUB_VENDAS}")
+            continue
+
         # Pega apenas os arquivos relevantes
-        for file in os.listdir(CAMINHO_SUB_VENDAS):
-            caminho_sub_vendas = os.path.join(CAMINHO_SUB_VENDAS, file)
-
-            if 'Vendas' in file and 'BR' in file:
-                df = pd.read_excel(caminho_sub_vendas, header=5, engine='openpyxl')
-
-                # Traduz e normaliza data
-                df['data'] = pd.to_datetime(df['Data da venda'].apply(traduzir_data), errors='coerce')
-
-                # Guarda o SKU original antes do explode
-                df['SKU_original'] = df['SKU']
-
-                # Explode a coluna SKU
-                df['SKU'] = df['SKU'].astype(str).str.split(' ')
-                df = df.explode('SKU').reset_index(drop=True)
-
-                # Preenche datas ausentes com a última data conhecida dentro do SKU original
-                df['data'] = df.groupby('SKU_original')['data'].transform(lambda x: x.ffill().bfill())
-
-                # Formata data para string
-                df['data'] = df['data'].dt.strftime('%Y-%m-%d')
-
-                # Aplica função de tratamento de SKU (retorna quantidade e SKU limpo)
-                df[['quantidade_itens', 'sku']] = df['SKU'].apply(lambda x: pd.Series(tratar_SKU(x)))
-
-                # Remove linhas com SKU inválido
-                df = df[df['sku'].notnull() & (df['sku'] != '')]
-
-                # Conversões seguras
-                df['quantidade_itens'] = pd.to_numeric(df['quantidade_itens'], errors='coerce').fillna(0).astype(int)
-                df['Unidades'] = pd.to_numeric(df['Unidades'], errors='coerce').fillna(0).astype(int)
-
-                # Cálculo total e colunas extras
-                df['quantidade_total'] = df['quantidade_itens'] * df['Unidades']
-                df['contas'] = contas
-                df['quantidade'] = df['Unidades']
-
-                # Adiciona ao file_list apenas as colunas necessárias
-                file_list.append(df[['sku', 'quantidade_itens', 'quantidade_total', 'contas', 'data', 'quantidade']])
-
-            if 'Order' in file and 'all' in file:
-                try:
-                    df = pd.read_excel(caminho_sub_vendas, header=0)
-                    if 'Número de referência SKU' in df.columns:
-                        df.rename(columns={'Nº de referência do SKU principal': 'SKU'}, inplace=True)     
-                    df['SKU'] = df['SKU'].str.split(' ').explode('SKU')
-                    df[['quantidade_itens', 'sku']] = df['SKU'].apply(lambda x: pd.Series(tratar_SKU(x)))
-                    # Remove linhas onde 'sku' é NaN ou string vazia
-                    df = df[df[['quantidade_itens', 'sku']].notnull() & (df[['quantidade_itens', 'sku']] != '')]
-                    df['quantidade_itens'] = pd.to_numeric(df['quantidade_itens'], errors='coerce').fillna(0.0).astype(float)
-                    df['Quantidade'] = pd.to_numeric(df['Quantidade'], errors='coerce').fillna(0.0).astype(float)
-                    df['quantidade_total'] = df['quantidade_itens'] * df['Quantidade']
-                    df['contas'] = contas
-                    df['data'] = pd.to_datetime(df['Data de criação do pedido'], errors='coerce').dt.strftime('%Y-%m-%d') 
-                    df['quantidade'] = df['Quantidade'] 
-                    file_list.append(df[['sku', 'quantidade_itens', 'quantidade_total', 'contas', 'data', 'quantidade']])
-                except Exception as e:
-                    print(f"Erro ao ler {file}: {e}")
-    
-    if file_list:
-        df_all = pd.concat(file_list, ignore_index=True)
-        
-        # Agrupa por conta, SKU e data somando os campos numéricos
-        df_all = df_all.groupby(['contas', 'sku', 'data']).agg({
-            'quantidade_itens': 'sum',
-            'quantidade_total': 'sum',
-            'quantidade': 'sum'
-        }).reset_index()
+        for file in sorted(os.listdir(CAMINHO_SUB_VENDAS)):
+            if ('Vendas' in file and 'BR' in file) or ('Order' in file and 'all' in file):
+                arquivos.append((contas, os.path.join(CAMINHO_SUB_VENDAS, file)))
+
+    return arquivos
 
-        # Corrige o tipo de data
-        df_all['data'] = pd.to_datetime(df_all['data'])
+# Lê e normaliza um arquivo de vendas, devolvendo as colunas gravadas na tabela 'vendas'
+def ler_arquivo_vendas(caminho_sub_vendas, contas):
+    file = os.path.basename(caminho_sub_vendas)
+    file_list = []
 
-        df_all.to_excel('vendas.xlsx', index=False)
+    if 'Vendas' in file and 'BR' in file:
+        with etapa('vendas.read_excel', arquivo=caminho_sub_vendas) as registro:
+            df = pd.read_excel(caminho_sub_vendas, header=5, engine='openpyxl')
+            registro['linhas'] = len(df)
 
-        # Define o range de datas global (mínimo e máximo considerando todos os SKUs e contas)
-        data_inicio_global = df_all['data'].min()
-        data_fim_global = df_all['data'].max()
-        todas_as_datas = pd.date_range(start=data_inicio_global, end=data_fim_global, freq='D')
+        # Traduz e normaliza data
+        with etapa('vendas.datas', arquivo=caminho_sub_vendas):
+            df['data'] = traduzir_data_coluna(df['Data da venda'])
 
-        # Lista para os resultados finais
-        todos_registros = []
+        # Guarda o SKU original antes do explode
+        df['SKU_original'] = df['SKU']
 
-        # Para cada (conta, sku), criar todas as datas no intervalo global
-        for (conta, sku), grupo in df_all.groupby(['contas', 'sku']):
-            grupo = grupo.set_index('data')
-            grupo = grupo.reindex(todas_as_datas, fill_value=0)
+        # Explode a coluna SKU
+        df['SKU'] = df['SKU'].astype(str).str.split(' ')
+        df = df.explode('SKU').reset_index(drop=True)
 
-            # Recupera data como coluna
-            grupo['data'] = grupo.index
-            grupo = grupo.reset_index(drop=True)
+        # Preenche datas ausentes com a última data conhecida dentro do SKU original
+        df['data'] = df.groupby('SKU_original')['data'].transform(lambda x: x.ffill().bfill())
 
-            # Repreenche as colunas 'contas' e 'sku' (porque as novas datas criadas perdem isso)
-            grupo['contas'] = conta
-            grupo['sku'] = sku
+        # Formata data para string
+        df['data'] = df['data'].dt.strftime('%Y-%m-%d')
 
-            todos_registros.append(grupo)
+        # Aplica função de tratamento de SKU (retorna quantidade e SKU limpo)
+        with etapa('vendas.sku', arquivo=caminho_sub_vendas) as registro:
+            df[['quantidade_itens', 'sku']] = tratar_SKU_coluna(df['SKU'])
+            registro['linhas'] = len(df)
 
-        # Junta todos os grupos novamente
-        df_all = pd.concat(todos_registros, ignore_index=True)
+        # Remove linhas com SKU inválido
+        df = df[df['sku'].notnull() & (df['sku'] != '')]
 
-        # Se quiser, pode ordenar
-        df_all = df_all.sort_values(by=['contas', 'sku', 'data']).reset_index(drop=True)
+        # Conversões seguras
+        df['quantidade_itens'] = pd.to_numeric(df['quantidade_itens'], errors='coerce').fillna(0).astype(int)
+        df['Unidades'] = pd.to_numeric(df['Unidades'], errors='coerce').fillna(0).astype(int)
 
-        # conexão com o banco de dados para enviar para a tabela 'vendas'
-        with sqlite3.connect(BANCO_DE_DADOS) as conn:
-            cursor = conn.cursor()
-            for _, row in df_all.iterrows():
-                cursor.execute("""
-                    INSERT INTO vendas (sku, quantidade_itens, quantidade_total, contas ,quantidade, data)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (row['sku'], row['quantidade_itens'], row['quantidade_total'], row['contas'], row['quantidade'], row['data'].strftime('%Y-%m-%d') ))
-            conn.commit()
-            print("Dados inseridos com sucesso no banco.") 
+        # Cálculo total e colunas extras
+        df['quantidade_total'] = df['quantidade_itens'] * df['Unidades']
+        df['contas'] = contas
+        df['quantidade'] = df['Unidades']
+
+        # Adiciona ao file_list apenas as colunas necessárias
+        file_list.append(df[['sku', 'quantidade_itens', 'quantidade_total', 'contas', 'data', 'quantidade']])
+
+    if 'Order' in file and 'all' in file:
+        try:
+            with etapa('vendas.read_excel', arquivo=caminho_sub_vendas) as registro:
+                df = pd.read_excel(caminho_sub_vendas, header=0)
+                registro['linhas'] = len(df)
+            if 'Número de referência SKU' in df.columns:
+                df.rename(columns={'Nº de referência do SKU principal': 'SKU'}, inplace=True)     
+            # Explode a coluna SKU, uma linha por SKU da célula (como nos arquivos 'Vendas')
+            df['SKU'] = df['SKU'].astype(str).str.split(' ')
+            df = df.explode('SKU').reset_index(drop=True)
+            with etapa('vendas.sku', arquivo=caminho_sub_vendas) as registro:
+                df[['quantidade_itens', 'sku']] = tratar_SKU_coluna(df['SKU'])
+                registro['linhas'] = len(df)
+            # Remove linhas onde 'sku' é NaN ou string vazia (máscara por linha: as outras colunas ficam intactas)
+            df = df[df['sku'].notnull() & (df['sku'] != '') & df['quantidade_itens'].notnull()]
+            df['quantidade_itens'] = pd.to_numeric(df['quantidade_itens'], errors='coerce').fillna(0.0).astype(float)
+            df['Quantidade'] = pd.to_numeric(df['Quantidade'], errors='coerce').fillna(0.0).astype(float)
+            df['quantidade_total'] = df['quantidade_itens'] * df['Quantidade']
+            df['contas'] = contas
+            df['data'] = pd.to_datetime(df['Data de criação do pedido'], errors='coerce').dt.strftime('%Y-%m-%d') 
+            df['quantidade'] = df['Quantidade'] 
+            file_list.append(df[['sku', 'quantidade_itens', 'quantidade_total', 'contas', 'data', 'quantidade']])
+        except Exception as e:
+            print(f"Erro ao ler {file}: {e}")
+            return FalhaLeitura(caminho_sub_vendas, str(e))
+
+    if not file_list:
+        return None
+    return pd.concat(file_list, ignore_index=True)
+
+# Impressão digital da lógica de leitura: muda quando o código que mapeia "Data da venda", "SKU",
+# "Unidades" ou "Quantidade" muda, invalidando o cache
+def versao_leitura_vendas():
+    funcoes = (ler_arquivo_vendas, tratar_SKU_coluna, corrigir_parte1, traduzir_data_coluna, traduzir_data)
+    fontes = ''.join(inspect.getsource(funcao) for funcao in funcoes)
+    return hashlib.sha256(fontes.encode('utf-8')).hexdigest()
+
+# Caminho do arquivo de cache para um arquivo de vendas (conteúdo, conta, nome e versão da leitura)
+def caminho_cache_vendas(caminho, contas, hash_):
+    chave = '|'.join([hash_, contas, os.path.basename(caminho), versao_leitura_vendas()])
+    return os.path.join(PASTA_CACHE_VENDAS, hashlib.sha256(chave.encode('utf-8')).hexdigest() + '.arrow')
+
+# Apaga os caches usados há mais tempo até o total caber em TAMANHO_MAXIMO_CACHE
+def limpar_cache_vendas(tamanho_maximo=TAMANHO_MAXIMO_CACHE):
+    if not os.path.isdir(PASTA_CACHE_VENDAS):
+        return
+    arquivos = []
+    for nome in os.listdir(PASTA_CACHE_VENDAS):
+        if nome.endswith('.arrow'):
+            caminho = os.path.join(PASTA_CACHE_VENDAS, nome)
+            # Outro processo de leitura pode ter apagado o arquivo no meio do caminho
+            try:
+                info = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            arquivos.append((info.st_mtime, info.st_size, caminho))
+
+    total = 0
+    for _, tamanho, arquivo in sorted(arquivos, reverse=True):
+        total += tamanho
+        if total > tamanho_maximo:
+            try:
+                os.remove(arquivo)
+            except FileNotFoundError:
+                pass
+
+# Lê um arquivo de vendas usando o cache quando possível; o cache é lido por memory map
+def ler_arquivo_vendas_cache(caminho, contas, hash_=None):
+    pa = carregar_pyarrow()
+    if pa is None:
+        return ler_arquivo_vendas(caminho, contas)
+
+    hash_ = hash_ or hash_arquivo(caminho)
+    caminho_cache = caminho_cache_vendas(caminho, contas, hash_)
+
+    if os.path.exists(caminho_cache):
+        with pa.memory_map(caminho_cache) as fonte:
+            df = pa.ipc.open_file(fonte).read_all().to_pandas()
+        # mtime marca o último uso para a limpeza
+        os.utime(caminho_cache)
+        return df
+
+    df = ler_arquivo_vendas(caminho, contas)
+    if df is None or isinstance(df, FalhaLeitura):
+        return df
+
+    try:
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        os.makedirs(PASTA_CACHE_VENDAS, exist_ok=True)
+        temporario = f"{caminho_cache}.{os.getpid()}.tmp"
+        with pa.OSFile(temporario, 'wb') as destino:
+            with pa.ipc.new_file(destino, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+        os.replace(temporario, caminho_cache)
+        limpar_cache_vendas()
+    except (pa.ArrowException, OSError) as e:
+        print(f"Não foi possível gravar o cache de {caminho}: {e}")
+
+    return df
+
+# Troca o banco de dados usado (e a pasta de cache, que fica ao lado dele)
+def definir_banco(caminho):
+    global BANCO_DE_DADOS, PASTA_CACHE_VENDAS
+    # As conexões da sessão são do banco anterior
+    fechar_conexoes()
+    BANCO_DE_DADOS = caminho
+    PASTA_CACHE_VENDAS = os.path.join(os.path.dirname(caminho), 'cache_vendas')
+
+# Roda no início de cada processo do pool: o mesmo banco e a mesma execução (nas métricas) do processo
+# principal, inclusive quando o processo é iniciado do zero (spawn, no Windows) e não herda as globais
+def iniciar_processo(caminho, execucao):
+    global EXECUCAO
+    EXECUCAO = execucao
+    definir_banco(caminho)
+
+# Executa funcao(*tarefa) para cada tarefa num pool de processos e devolve os resultados na ordem das tarefas.
+# Só o processo principal grava no banco
+def executar_em_paralelo(funcao, tarefas, workers=None):
+    workers = min(workers or PROCESSOS_LEITURA, len(tarefas))
+    if workers <= 1:
+        return [funcao(*tarefa) for tarefa in tarefas]
+    with ProcessPoolExecutor(max_workers=workers, initializer=iniciar_processo, initargs=(BANCO_DE_DADOS, EXECUCAO)) as executor:
+        return list(executor.map(funcao, *zip(*tarefas)))
+
+# Como executar_em_paralelo, mas entrega cada resultado assim que ele fica pronto (a ordem pode variar)
+def resultados_em_paralelo(funcao, tarefas, workers=None):
+    workers = min(workers or PROCESSOS_LEITURA, len(tarefas))
+    if workers <= 1:
+        for tarefa in tarefas:
+            yield funcao(*tarefa)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=iniciar_processo, initargs=(BANCO_DE_DADOS, EXECUCAO)) as executor:
+        futuros = [executor.submit(funcao, *tarefa) for tarefa in tarefas]
+        for futuro in as_completed(futuros):
+            yield futuro.result()
+
+# Reduz a memória de um DataFrame: as colunas de COLUNAS_CATEGORICAS viram categoria e as colunas inteiras
+# passam para o menor tipo inteiro que guarda os valores (as decimais continuam float64). Altera e devolve o próprio df
+def tipos_compactos(df, categorias=COLUNAS_CATEGORICAS):
+    if not COMPACTAR_TIPOS:
+        return df
+    for coluna in df.columns:
+        if coluna in categorias:
+            if not isinstance(df[coluna].dtype, pd.CategoricalDtype):
+                df[coluna] = df[coluna].astype('category')
+        elif pd.api.types.is_integer_dtype(df[coluna]):
+            df[coluna] = pd.to_numeric(df[coluna], downcast='integer')
+    return df
+
+# Concatena DataFrames de tipos_compactos mantendo as categorias (o pd.concat volta para texto quando elas
+# diferem). As categorias ficam em ordem alfabética, então ordenar pela coluna dá a mesma ordem do texto
+def concatenar_compacto(frames):
+    frames = list(frames)
+    for coluna in frames[0].columns:
+        if isinstance(frames[0][coluna].dtype, pd.CategoricalDtype):
+            categorias = pd.Index(sorted(set().union(*(df[coluna].cat.categories for df in frames))))
+            for df in frames:
+                df[coluna] = df[coluna].cat.set_categories(categorias)
+    return pd.concat(frames, ignore_index=True)
+
+# Lê um arquivo de vendas já somado por (contas, sku, data), com o caminho de origem (usado na atualização incremental).
+# Volta com tipos_compactos, para trafegar entre os processos e ser concatenado com pouca memória
+def ler_contribuicao_vendas(caminho, contas, hash_=None):
+    with etapa('vendas.arquivo', arquivo=caminho) as registro:
+        df = ler_arquivo_vendas_cache(caminho, contas, hash_)
+        if isinstance(df, FalhaLeitura):
+            registro['erro'] = df.erro
+            return df
+        print(f"Arquivo lido com sucesso: {caminho}")
+        if df is None:
+            return None
+        registro['linhas'] = len(df)
+        df = df.groupby(['contas', 'sku', 'data'])[['quantidade_itens', 'quantidade_total', 'quantidade']].sum().reset_index()
+    df['caminho'] = caminho
+    return tipos_compactos(df)
+
+# Lê todos os arquivos de vendas em 'workers' processos e soma por (contas, sku, data), sem gravar nada.
+# Retorna None se não houver vendas
+def agrupar_arquivos_vendas(workers=None):
+    # Resultados na ordem de listar_arquivos_vendas, então o agrupamento não depende do paralelismo
+    resultados = executar_em_paralelo(ler_contribuicao_vendas, [(caminho, contas) for contas, caminho in listar_arquivos_vendas()], workers)
+    file_list = [df.drop(columns='caminho') for df in resultados if isinstance(df, pd.DataFrame)]
+    if not file_list:
+        return None
+
+    df_all = concatenar_compacto(file_list)
+
+    # Agrupa por conta, SKU e data somando os campos numéricos (observed: só as combinações que existem)
+    return df_all.groupby(['contas', 'sku', 'data'], observed=True).agg({
+        'quantidade_itens': 'sum',
+        'quantidade_total': 'sum',
+        'quantidade': 'sum'
+    }).reset_index()
+
+# Traz os arquivos das vendas. Por padrão só lê arquivos novos ou alterados (ver atualizar_vendas_incremental);
+# com incremental=False apaga as vendas e o manifesto e relê tudo, numa só transação.
+# Retorna os SKUs cujo histórico mudou, ou None quando tudo foi relido. Os arquivos são lidos em 'workers' processos
+@medido('vendas')
+def g_arquivos_vendas(incremental=True, workers=None): 
+    return atualizar_vendas_incremental(workers, completo=not incremental)
+
+# Atualização incremental das vendas: usa o manifesto (caminho, tamanho, mtime, hash) para ler só
+# arquivos novos ou alterados e regrava apenas as linhas (conta, sku, data) afetadas por eles.
+# Arquivos que sumiram da pasta têm a contribuição removida. Retorna os SKUs com histórico alterado,
+# ou None quando o intervalo global de datas mudou (aí todas as séries mudam). Com completo=True o manifesto
+# começa vazio e 'vendas', 'vendas_por_arquivo' e 'manifesto_arquivos' são refeitas do zero na mesma transação
+def atualizar_vendas_incremental(workers=None, completo=False):
+    conn = conectar_escrita()
+    migrar_banco(conn)
+
+    manifesto = {} if completo else {
+        caminho: (tamanho, mtime, hash_)
+        for caminho, tamanho, mtime, hash_ in conn.execute("SELECT caminho, tamanho, mtime, hash FROM manifesto_arquivos")
+    }
+
+    arquivos = listar_arquivos_vendas()
+    data_atual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    registros_manifesto = {}
+    alterados = []
+
+    for contas, caminho in arquivos:
+        info = os.stat(caminho)
+        anterior = manifesto.get(caminho)
+
+        # Mesmo tamanho e mtime: arquivo já processado
+        if anterior and anterior[0] == info.st_size and anterior[1] == info.st_mtime:
+            continue
+
+        hash_ = hash_arquivo(caminho)
+        registros_manifesto[caminho] = (caminho, contas, info.st_size, info.st_mtime, hash_, data_atual)
+
+        # Só o mtime mudou, o conteúdo é o mesmo
+        if anterior and anterior[2] == hash_:
+            continue
+
+        alterados.append((contas, caminho, hash_))
+
+    removidos = sorted(set(manifesto) - {caminho for _, caminho in arquivos})
+
+    resultados = executar_em_paralelo(ler_contribuicao_vendas, [(caminho, contas, hash_) for contas, caminho, hash_ in alterados], workers)
+    contribuicoes = [df for df in resultados if isinstance(df, pd.DataFrame)]
+
+    # Arquivo com erro de leitura fica fora do manifesto e mantém a contribuição antiga: é lido de novo na próxima carga
+    falhas = [resultado for resultado in resultados if isinstance(resultado, FalhaLeitura)]
+    com_falha = {falha.caminho for falha in falhas}
+    alterados = [alterado for alterado in alterados if alterado[1] not in com_falha]
+    for caminho in com_falha:
+        del registros_manifesto[caminho]
+
+    try:
+        if completo:
+            # Tudo é relido: as tabelas ficam só com o que está na pasta agora
+            for tabela in ('vendas', 'vendas_por_arquivo', 'manifesto_arquivos'):
+                conn.execute(f"DELETE FROM {tabela}")
+            regravar_vendas_afetadas(conn, [c for _, c, _ in alterados], contribuicoes)
+            skus_alterados = None
+        elif alterados or removidos:
+            skus_alterados = regravar_vendas_afetadas(conn, [c for _, c, _ in alterados] + removidos, contribuicoes)
+        else:
+            skus_alterados = set()
+
+        conn.executemany("INSERT OR REPLACE INTO manifesto_arquivos VALUES (?, ?, ?, ?, ?, ?)", list(registros_manifesto.values()))
+        conn.executemany("DELETE FROM manifesto_arquivos WHERE caminho = ?", [(c,) for c in removidos])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    for falha in falhas:
+        print(f"⚠️ Erro ao ler {falha.caminho} ({falha.erro}); o arquivo será lido de novo na próxima carga.")
+    if completo:
+        print(f"{len(alterados)} arquivo(s) de vendas relido(s) do zero.")
+    elif not alterados and not removidos:
+        print("Nenhum arquivo de vendas novo ou alterado.")
+    else:
+        print(f"{len(alterados)} arquivo(s) novo(s) ou alterado(s), {len(removidos)} removido(s), "
+              + ("intervalo de datas alterado." if skus_alterados is None else f"{len(skus_alterados)} SKU(s) com vendas alteradas."))
+    return skus_alterados
+
+# Troca as contribuições dos arquivos em 'caminhos' e regrava em 'vendas' as chaves (conta, sku, data) afetadas.
+# Chaves que nenhum arquivo tem mais são apagadas. Não faz commit
+def regravar_vendas_afetadas(conn, caminhos, contribuicoes):
+    colunas_chave = ['contas', 'sku', 'data']
+    colunas_valores = ['quantidade_itens', 'quantidade_total', 'quantidade']
+
+    conn.execute(TABELAS_TEMPORARIAS['caminhos_afetados'])
+    conn.execute(TABELAS_TEMPORARIAS['chaves_afetadas'])
+    conn.execute("DELETE FROM caminhos_afetados")
+    conn.execute("DELETE FROM chaves_afetadas")
+    conn.executemany("INSERT OR IGNORE INTO caminhos_afetados VALUES (?)", [(c,) for c in caminhos])
+
+    intervalo_antigo = intervalo_vendas(conn)
+
+    # Chaves que os arquivos tinham antes e que têm agora
+    chaves_antigas = pd.read_sql_query(CONSULTA_CHAVES_ARQUIVOS, conn)
+    conn.execute(APAGAR_CONTRIBUICOES_ARQUIVOS)
+
+    chaves = [chaves_antigas]
+    if contribuicoes:
+        df_novo = concatenar_compacto(contribuicoes)
+        gravar_em_lote('vendas_por_arquivo', df_novo, ['caminho'] + colunas_chave + colunas_valores,
+                       conn=conn, tamanho_lote=None, confirmar=False)
+        chaves.append(df_novo[colunas_chave].astype(object))
+    chaves = pd.concat(chaves, ignore_index=True).drop_duplicates()
+
+    if chaves.empty:
+        return set()
+
+    # Soma atual de todos os arquivos para cada chave afetada
+    gravar_em_lote('chaves_afetadas', chaves, colunas_chave, conn=conn, tamanho_lote=None, confirmar=False)
+    linhas = pd.read_sql_query(CONSULTA_SOMA_CHAVES, conn)
+
+    # Substitui as linhas das chaves afetadas
+    with etapa('vendas.gravacao', linhas=len(linhas)):
+        conn.execute(APAGAR_VENDAS_CHAVES)
+        gravar_em_lote('vendas', linhas, ['sku', 'quantidade_itens', 'quantidade_total', 'contas', 'quantidade', 'data'],
+                       conn=conn, tamanho_lote=None, confirmar=False)
+
+    # Com o intervalo global diferente, a série densificada de todos os pares muda
+    if intervalo_vendas(conn) != intervalo_antigo:
+        return None
+    return set(chaves['sku'])
+
+# Índices dos pontos mantidos ao desenhar uma série longa: em cada faixa de dias ficam o menor e o maior valor,
+# então os picos continuam aparecendo com no máximo max_pontos pontos por linha
+def reduzir_pontos(valores, max_pontos=PONTOS_POR_LINHA):
+    valores = np.asarray(valores, dtype=float)
+    n = len(valores)
+    if n <= max_pontos:
+        return np.arange(n)
+
+    faixa = np.arange(n) * (max_pontos // 2) // n
+    # Ordena por faixa e, dentro dela, por valor: o primeiro de cada faixa é o menor e o último o maior
+    ordem = np.lexsort((valores, faixa))
+    inicio = np.r_[0, np.flatnonzero(np.diff(faixa[ordem])) + 1]
+    fim = np.r_[inicio[1:], n] - 1
+    return np.unique(np.r_[ordem[inicio], ordem[fim]])
+
+# Série prevista com as datas logo depois do último dia do histórico 'grupo' (como nas opções 4, 5 e 6)
+def serie_prevista(grupo, valores):
+    valores = np.ravel(valores)
+    datas = pd.date_range(start=grupo['data'].max() + pd.Timedelta(days=1), periods=len(valores))
+    return pd.DataFrame({'data': datas, 'quantidade_prevista': valores})
+
+# Argumentos de desenhar_grafico para "Previsão vs Vendas": 'vendas' com data e quantidade,
+# 'previsao' com data e quantidade_prevista
+def grafico_vendas(sku, vendas, previsao, conta=None):
+    return {
+        'titulo': f"Previsão vs Vendas - SKU: {sku}" + (f" | Conta: {conta}" if conta else ""),
+        'datas_reais': pd.to_datetime(vendas['data']), 'reais': vendas['quantidade'],
+        'datas_previstas': pd.to_datetime(previsao['data']), 'previstos': previsao['quantidade_prevista'],
+    }
+
+# Argumentos de desenhar_grafico para "Previsão vs Estoque": 'estoque' com data e quantidade_estoque
+def grafico_estoque(sku, estoque, previsao):
+    return {
+        'titulo': f"Previsão vs Estoque - SKU: {sku}",
+        'datas_reais': pd.to_datetime(estoque['data']), 'reais': estoque['quantidade_estoque'],
+        'datas_previstas': pd.to_datetime(previsao['data']), 'previstos': previsao['quantidade_prevista'],
+        'rotulo_real': 'Estoque', 'rotulo_previsto': 'Previsão de estoque',
+    }
+
+# Desenha o histórico e a previsão num eixo. Na primeira vez cria as duas linhas e o formato do eixo; nas
+# seguintes só troca os dados delas, então a mesma figura serve para vários SKUs. As linhas passam por
+# reduzir_pontos em vez de marcar cada um dos dias
+def desenhar_grafico(ax, titulo, datas_reais, reais, datas_previstas, previstos,
+                     rotulo_real='Vendas reais', rotulo_previsto='Previsão de vendas'):
+    pontos_reais = reduzir_pontos(reais)
+    pontos_previstos = reduzir_pontos(previstos)
+    x_real, y_real = np.asarray(datas_reais)[pontos_reais], np.asarray(reais, dtype=float)[pontos_reais]
+    x_previsto, y_previsto = np.asarray(datas_previstas)[pontos_previstos], np.asarray(previstos, dtype=float)[pontos_previstos]
+
+    if len(ax.lines) != 2:
+        import matplotlib.dates as mdates
+        from matplotlib.ticker import MaxNLocator
+
+        ax.clear()
+        ax.plot(x_real, y_real, color='blue')
+        ax.plot(x_previsto, y_previsto, linestyle='--', color='orange')
+        ax.set_xlabel("Data")
+        ax.set_ylabel("Quantidade")
+        ax.grid(True)
+
+        # Limitar número de ticks no eixo X
+        ax.xaxis.set_major_locator(MaxNLocator(nbins=20))
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+        ax.tick_params(axis='x', labelrotation=45)
+
+    linha_real, linha_prevista = ax.lines
+    linha_real.set_data(x_real, y_real)
+    linha_prevista.set_data(x_previsto, y_previsto)
+    # Séries curtas (ex:. estoque com poucas leituras) ganham marcadores, senão um ponto só não aparece
+    linha_real.set_marker('o' if len(x_real) <= PONTOS_COM_MARCADOR else 'None')
+    linha_prevista.set_marker('x' if len(x_previsto) <= PONTOS_COM_MARCADOR else 'None')
+    # Sem histórico a linha fica vazia e some da legenda
+    linha_real.set_label(rotulo_real if len(reais) else '_' + rotulo_real)
+    linha_prevista.set_label(rotulo_previsto)
+
+    ax.set_title(titulo)
+    ax.legend()
+    ax.relim()
+    ax.autoscale_view()
+
+# Mostra na tela os gráficos (argumentos de desenhar_grafico) um abaixo do outro, na mesma janela.
+# A figura é fechada depois, para não acumular figuras abertas no menu
+def mostrar_graficos(*graficos):
+    plt = carregar_graficos()
+    fig, eixos = plt.subplots(len(graficos), 1, squeeze=False,
+                              figsize=(TAMANHO_GRAFICO[0], TAMANHO_GRAFICO[1] * len(graficos)))
+    for ax, grafico in zip(eixos[:, 0], graficos):
+        desenhar_grafico(ax, **grafico)
+    fig.tight_layout()
+    plt.show()
+    plt.close(fig)
+
+# Grava em 'pasta' os gráficos de uma lista de (sku, tipos), com uma só figura reaproveitada para todos.
+# Usa a Figure do matplotlib direto (sem pyplot): nada aparece na tela. Roda dentro dos processos da renderização
+def gravar_graficos_skus(itens, pasta):
+    from matplotlib.figure import Figure
+
+    # Margens fixas: todos os gráficos têm o mesmo formato, então não é preciso recalcular o layout a cada imagem
+    fig = Figure(figsize=TAMANHO_GRAFICO, dpi=DPI_GRAFICO)
+    fig.subplots_adjust(left=0.08, right=0.96, top=0.93, bottom=0.22)
+    ax = fig.add_subplot()
+    gravados = 0
+
+    conn = conexao(somente_leitura=True)
+    for sku, tipos in itens:
+        graficos = []
+        if 'vendas' in tipos:
+            previsao = ler_previsoes(conn, sku).groupby('data', as_index=False)['quantidade_prevista'].sum()
+            vendas = ler_vendas_densas(sku)
+            vendas = vendas.groupby('data', as_index=False)['quantidade'].sum()
+            graficos.append(('vendas', grafico_vendas(sku, vendas, previsao)))
+        if 'estoque' in tipos:
+            grupo, estoque_previsto, _ = previsao_estoque(sku, retornar_dados=True)
+            if grupo is not None:
+                graficos.append(('estoque', grafico_estoque(sku, grupo, serie_prevista(grupo, estoque_previsto))))
+
+        # SKUs podem ter caracteres que não valem em nome de arquivo
+        nome_sku = re.sub(r'[^\w.-]+', '_', str(sku))
+        for tipo, grafico in graficos:
+            desenhar_grafico(ax, **grafico)
+            fig.savefig(os.path.join(pasta, f"{tipo}_{nome_sku}.png"))
+            gravados += 1
+
+    return len(itens), gravados
+
+# Grava (sem tela) os gráficos "Previsão vs Vendas" e "Previsão vs Estoque" de 'skus', ou do catálogo todo,
+# numa pasta do dia dentro de PASTA_SAIDA. Os SKUs são divididos em tarefas de GRAFICOS_POR_TAREFA entre
+# 'workers' processos. Retorna a pasta dos gráficos
+@medido('graficos')
+def renderizar_graficos(skus=None, tipos=('vendas', 'estoque'), workers=None):
+    # Só há gráfico de vendas para SKUs já previstos, e de estoque para os que também têm estoque
+    conn = conexao(somente_leitura=True)
+    com_previsao = {sku for (sku,) in conn.execute(
+        "SELECT sku FROM coeficientes_previsao UNION SELECT sku FROM previsão_futura")}
+    com_estoque = {sku for (sku,) in conn.execute("SELECT DISTINCT sku FROM estoque")} & com_previsao
+
+    candidatos = {'vendas': com_previsao, 'estoque': com_estoque}
+    tipos_por_sku = {}
+    for tipo in tipos:
+        for sku in candidatos[tipo] if skus is None else candidatos[tipo] & set(skus):
+            tipos_por_sku.setdefault(sku, []).append(tipo)
+
+    pasta = os.path.join(PASTA_SAIDA, f"graficos_{data()}")
+    os.makedirs(pasta, exist_ok=True)
+
+    # Catálogo pequeno: tarefas menores, para todos os processos terem o que fazer
+    itens = sorted(tipos_por_sku.items())
+    por_tarefa = max(1, min(GRAFICOS_POR_TAREFA, -(-len(itens) // (workers or PROCESSOS_LEITURA))))
+    tarefas = [(itens[i:i + por_tarefa], pasta) for i in range(0, len(itens), por_tarefa)]
+
+    feitos, gravados = 0, 0
+    for n_skus, n_graficos in resultados_em_paralelo(gravar_graficos_skus, tarefas, workers):
+        feitos += n_skus
+        gravados += n_graficos
+        print(f"Gráficos: {feitos}/{len(itens)} SKUs ({feitos / len(itens):.0%})")
+
+    print(f"{gravados} gráfico(s) gravado(s) em {pasta}.")
+    return pasta
+
+# Gera dados sintéticos no formato de Entrada/ em 'pasta', com as mesmas colunas das exportações:
+# - 'Vendas_<n>_BR.xlsx': cabeçalho na linha 6 e datas por extenso em português ("3 de março de 2024 14:05 hs."),
+#   com SKUs de kit ("2-..."), sem hífen, células com vários SKUs e células vazias;
+# - 'Order_all_<n>.xlsx': um por conta;
+# - 'estoque.csv': separado por ';' e com o estoque decimal com vírgula.
+# Cada arquivo de vendas cobre um trecho dos 'dias'. A mesma semente gera os mesmos arquivos.
+def gerar_entrada_sintetica(pasta, skus=ESCALA_BENCHMARK['skus'], dias=ESCALA_BENCHMARK['dias'],
+                            linhas_por_arquivo=ESCALA_BENCHMARK['linhas_por_arquivo'],
+                            arquivos_por_conta=ESCALA_BENCHMARK['arquivos_por_conta'], seed=0, inicio='2024-01-01'):
+    rng = np.random.default_rng(seed)
+    meses = np.array(list(MESES_PT_EN), dtype=object)
+    codigos = np.array([str(100000 + i) for i in range(skus)], dtype=object)
+
+    # Poucos SKUs vendem muito (popularidade de Zipf)
+    popularidade = 1 / np.arange(1, skus + 1) ** 0.8
+    popularidade /= popularidade.sum()
+
+    # Momento de cada venda (em minutos desde 'inicio') dentro do trecho de dias do arquivo
+    def momentos(arquivo, n_linhas):
+        primeiro = dias * arquivo // arquivos_por_conta
+        ultimo = max(dias * (arquivo + 1) // arquivos_por_conta, primeiro + 1)
+        minutos = rng.integers(primeiro * 1440, ultimo * 1440, n_linhas)
+        return pd.Series(pd.Timestamp(inicio) + pd.to_timedelta(np.sort(minutos), unit='m'))
+
+    for conta in CONTAS.values():
+        pasta_vendas = os.path.join(pasta, 'Vendas', conta)
+        os.makedirs(pasta_vendas, exist_ok=True)
+
+        for arquivo in range(arquivos_por_conta):
+            datas = momentos(arquivo, linhas_por_arquivo)
+            texto_datas = (datas.dt.day.astype(str) + ' de ' + meses[datas.dt.month - 1] + ' de '
+                           + datas.dt.year.astype(str) + ' ' + datas.dt.strftime('%H:%M') + ' hs.')
+
+            # Formatos de SKU das planilhas: '1-<código>' na maioria, kits '2-<código>', sem hífen,
+            # dois SKUs na mesma célula e células vazias
+            principal = rng.choice(codigos, linhas_por_arquivo, p=popularidade)
+            segundo = rng.choice(codigos, linhas_por_arquivo, p=popularidade)
+            sorteio = rng.random(linhas_por_arquivo)
+            sku = np.select(
+                [sorteio < 0.60, sorteio < 0.75, sorteio < 0.85, sorteio < 0.95],
+                ['1-' + principal, principal, '2-' + principal, '1-' + principal + ' 1-' + segundo],
+                default=None)
+
+            vendas = pd.DataFrame({
+                'N.º de venda': rng.integers(10 ** 12, 10 ** 13, linhas_por_arquivo),
+                'Data da venda': texto_datas,
+                'Estado': 'Entregue',
+                'Unidades': 1 + rng.poisson(0.4, linhas_por_arquivo),
+                'SKU': sku,
+            })
+            with pd.ExcelWriter(os.path.join(pasta_vendas, f'Vendas_{arquivo}_BR.xlsx'), engine='openpyxl') as escritor:
+                pd.DataFrame([['Relatório de vendas'], [f'Conta {conta}']]).to_excel(escritor, header=False, index=False)
+                vendas.to_excel(escritor, startrow=5, index=False)
+
+        # Pedidos no outro formato: SKU sozinho na célula e data ISO
+        n_pedidos = max(linhas_por_arquivo // 10, 1)
+        pedidos = pd.DataFrame({
+            'SKU': '1-' + rng.choice(codigos, n_pedidos, p=popularidade),
+            'Quantidade': 1 + rng.poisson(0.4, n_pedidos),
+            'Data de criação do pedido': momentos(arquivos_por_conta - 1, n_pedidos).dt.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        pedidos.to_excel(os.path.join(pasta_vendas, 'Order_all_0.xlsx'), index=False, engine='openpyxl')
+
+        pasta_estoque = os.path.join(pasta, 'Estoque', conta)
+        os.makedirs(pasta_estoque, exist_ok=True)
+        codigo = '1-' + codigos
+        varios = rng.random(skus) < 0.05
+        codigo[varios] = codigo[varios] + ' 1-' + rng.choice(codigos, varios.sum())
+        pd.DataFrame({
+            'Código': codigo,
+            'Descrição': 'Produto ' + codigos,
+            'Estoque': pd.Series(rng.integers(0, 500, skus)).astype(str) + ',0',
+        }).to_csv(os.path.join(pasta_estoque, 'estoque.csv'), sep=';', index=False)
+
+    print(f"Dados sintéticos gravados em {pasta} ({len(CONTAS)} contas, {skus} SKUs, {dias} dias).")
+    return pasta
+
+# Troca a pasta de entrada (vendas e estoque), como definir_banco faz com o banco
+def definir_entrada(pasta):
+    global PASTA_ENTRADA, PASTA_ESTOQUE, PASTA_VENDAS
+    PASTA_ENTRADA = pasta
+    PASTA_ESTOQUE = os.path.join(pasta, 'Estoque')
+    PASTA_VENDAS = os.path.join(pasta, 'Vendas')
+
+# Commit do git do app.py ('-alterado' se houver mudanças não commitadas); None fora de um repositório
+def commit_atual():
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=pasta, capture_output=True, text=True, check=True).stdout.strip()
+        alterado = subprocess.run(['git', 'status', '--porcelain', '--', os.path.basename(__file__)], cwd=pasta,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-alterado' if alterado else '')
+
+# Mede o pipeline de ponta a ponta sobre gerar_entrada_sintetica (pasta temporária e banco novo a cada repetição):
+# g_arquivos_vendas, g_arquivos_estoque, gerar_todas_previsoes e previsao_estoque de 'amostra' SKUs, além do
+# tempo de cada sub-etapa (ver etapa). A mediana das repetições é acrescentada em ARQUIVO_BENCHMARK com o commit
+def benchmark_pipeline(escala=None, repeticoes=3, workers=None, amostra=20, seed=0):
+    escala = {**ESCALA_BENCHMARK, **(escala or {})}
+    banco_original, entrada_original = BANCO_DE_DADOS, PASTA_ENTRADA
+    rodadas, sub_etapas = [], []
+
+    with tempfile.TemporaryDirectory() as temporaria:
+        gerar_entrada_sintetica(os.path.join(temporaria, 'Entrada'), seed=seed, **escala)
+        try:
+            definir_entrada(os.path.join(temporaria, 'Entrada'))
+            for repeticao in range(repeticoes):
+                # Banco e cache de leitura novos: toda repetição lê os arquivos do zero
+                os.makedirs(os.path.join(temporaria, str(repeticao)))
+                definir_banco(os.path.join(temporaria, str(repeticao), 'geral.db'))
+                chamar_funcao_banco()
+                comeco = datetime.now()
+                tempos = {}
+
+                inicio = time.perf_counter()
+                g_arquivos_vendas(workers=workers)
+                tempos['g_arquivos_vendas'] = time.perf_counter() - inicio
+
+                # Os arquivos 'Order_all' também precisam virar vendas, senão a medida não cobre a leitura deles
+                linhas_order, = conexao(somente_leitura=True).execute(
+                    "SELECT COUNT(*) FROM vendas_por_arquivo WHERE caminho LIKE '%Order_all%'").fetchone()
+                if not linhas_order:
+                    raise RuntimeError("os arquivos 'Order_all' sintéticos não geraram nenhuma venda")
+
+                inicio = time.perf_counter()
+                g_arquivos_estoque(workers=workers)
+                tempos['g_arquivos_estoque'] = time.perf_counter() - inicio
+
+                inicio = time.perf_counter()
+                gerar_todas_previsoes(workers=workers)
+                tempos['gerar_todas_previsoes'] = time.perf_counter() - inicio
+
+                skus = [sku for sku, in conexao(somente_leitura=True).execute(
+                    "SELECT sku FROM estoque ORDER BY sku LIMIT ?", (amostra,))]
+                inicio = time.perf_counter()
+                for sku in skus:
+                    previsao_estoque(sku, retornar_dados=True)
+                tempos['previsao_estoque'] = (time.perf_counter() - inicio) / max(len(skus), 1)
+
+                rodadas.append(tempos)
+                sub_etapas.extend(dict(registro, repeticao=repeticao) for registro in ler_metricas(comeco))
+        finally:
+            definir_banco(banco_original)
+            definir_entrada(entrada_original)
+
+    tempos = pd.DataFrame(rodadas).median()
+    detalhe = pd.DataFrame(sub_etapas).groupby(['repeticao', 'etapa'])['duracao_s'].sum().groupby('etapa').median()
+    registro = {
+        'data': datetime.now().isoformat(timespec='seconds'), 'commit': commit_atual(),
+        'python': sys.version.split()[0], 'pandas': pd.__version__, 'escala': escala,
+        'workers': workers, 'repeticoes': repeticoes, 'amostra': amostra, 'linhas_order': linhas_order,
+        'etapas': tempos.round(4).to_dict(), 'sub_etapas': detalhe.round(4).to_dict(), 'pico_mb': pico_memoria_mb(),
+    }
+    os.makedirs(os.path.dirname(ARQUIVO_BENCHMARK) or '.', exist_ok=True)
+    with open(ARQUIVO_BENCHMARK, 'a', encoding='utf-8') as arquivo:
+        arquivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+
+    print(f"\nBenchmark do pipeline (mediana de {repeticoes} repetição(ões), commit {registro['commit']}):")
+    for nome, tempo in tempos.items():
+        print(f"{nome:>22}: {tempo:8.3f} s" + (" por SKU" if nome == 'previsao_estoque' else ""))
+    print(f"Resultado acrescentado em {ARQUIVO_BENCHMARK}.")
+    return registro
+
+# Compara as rodadas gravadas por benchmark_pipeline: uma linha por rodada (data, commit, escala) e uma coluna por etapa
+def comparar_benchmarks(ultimas=10):
+    if not os.path.exists(ARQUIVO_BENCHMARK):
+        print(f"Nenhum benchmark gravado em {ARQUIVO_BENCHMARK}.")
+        return None
+    with open(ARQUIVO_BENCHMARK, encoding='utf-8') as arquivo:
+        registros = [json.loads(linha) for linha in arquivo if linha.strip()]
+
+    tabela = pd.DataFrame([{
+        'data': registro['data'], 'commit': registro['commit'],
+        'escala': '{skus}x{dias}x{linhas_por_arquivo}x{arquivos_por_conta}'.format(**registro['escala']),
+        **registro['etapas'],
+    } for registro in registros[-ultimas:]])
+    print(tabela.to_string(index=False, float_format=lambda valor: f"{valor:.3f}"))
+    return tabela
+
+# Catálogo de SKUs da sessão: carrega os SKUs distintos de cada tabela na primeira chamada (ou com recarregar=True)
+def catalogo_skus(recarregar=False):
+    if recarregar or not CATALOGO_SKUS:
+        conn = conexao(somente_leitura=True)
+        with etapa('catalogo.carga'):
+            por_tabela = {tabela: {sku for (sku,) in conn.execute(CONSULTA_SKUS_CATALOGO.format(tabela))}
+                          for tabela in TABELAS_CATALOGO}
+        CATALOGO_SKUS['tabelas'] = por_tabela
+        CATALOGO_SKUS['ordenados'] = sorted(set().union(*por_tabela.values()))
+    return CATALOGO_SKUS
+
+# Descarta o catálogo depois de uma carga; a próxima consulta lê o banco de novo
+def invalidar_catalogo_skus():
+    CATALOGO_SKUS.clear()
+
+# Tabelas de TABELAS_CATALOGO em que o SKU aparece (lista vazia se não está em nenhuma)
+def tabelas_do_sku(sku):
+    return [tabela for tabela, skus in catalogo_skus()['tabelas'].items() if sku in skus]
+
+# Até 'limite' SKUs do catálogo que começam com 'prefixo'. Na lista ordenada eles ficam juntos,
+# a partir da posição achada por busca binária
+def sugerir_skus(prefixo, limite=SUGESTOES_SKU):
+    ordenados = catalogo_skus()['ordenados']
+    inicio = bisect_left(ordenados, prefixo)
+    return [sku for sku in ordenados[inicio:inicio + limite] if sku.startswith(prefixo)]
+
+# Completa o SKU com TAB no input (readline): 'estado' é a posição da sugestão pedida
+def completar_sku(texto, estado):
+    sugestoes = sugerir_skus(texto)
+    return sugestoes[estado] if estado < len(sugestoes) else None
+
+# Pede um SKU no menu, com TAB completando pelo catálogo quando há readline
+def pedir_sku(mensagem):
+    readline = carregar_readline()
+    if readline is None:
+        return input(mensagem).strip()
+
+    anterior, delimitadores = readline.get_completer(), readline.get_completer_delims()
+    readline.set_completer(completar_sku)
+    readline.set_completer_delims('')
+    readline.parse_and_bind('tab: complete')
+    try:
+        return input(mensagem).strip()
+    finally:
+        readline.set_completer(anterior)
+        readline.set_completer_delims(delimitadores)
+
+# Confere o SKU no catálogo e diz em quais tabelas ele está; se não está em nenhuma, sugere SKUs
+# parecidos. Retorna as tabelas do SKU
+def conferir_sku(sku):
+    tabelas = tabelas_do_sku(sku)
+    if tabelas:
+        print(f"SKU '{sku}' encontrado em: {', '.join(tabelas)}")
+        return tabelas
+
+    print("ESSE SKU NÃO TEM DADOS NECESSÁRIOS PARA UMA BUSCA OU NÃO ESTÁ EM NENHUM DOS BANCOS DE DADOS, TENTE OUTRO!")
+    # Sem SKU com o começo todo, tenta começos cada vez menores (erro de digitação no fim)
+    for fim in range(len(sku), 0, -1):
+        sugestoes = sugerir_skus(sku[:fim])
+        if sugestoes:
+            break
+    else:
+        sugestoes = []
+    if sugestoes:
+        print(f"Você quis dizer: {', '.join(sugestoes)}?")
+    return tabelas
 
 # Função de interface e responsável por chamar todas as funsões principais, além de gerar os gráficos
 def main():
+    # Banco antigo ganha as tabelas novas (ex:. cache das previsões) antes de qualquer opção
+    chamar_funcao_banco()
+
     while True:
         print('Quais das opções abaixo deseja executar?\n'
               '\n1: Atualizar dados das vendas e gerar previsões!'
@@ -515,15 +2681,22 @@ def main():
         
         opcao = input('\nSelecione uma das opções:  ')
 
+        inicio_opcao = datetime.now()
+
         if opcao == '1':
             chamar_funcao_banco()
-            g_arquivos_vendas()
-            gerar_todas_previsoes()
+            skus_alterados = g_arquivos_vendas()
+            gerar_todas_previsoes(skus=skus_alterados)
+            invalidar_catalogo_skus()
             print("✅ Dados das vendas atualizados e previsões geradas!")
+            resumo_metricas(desde=inicio_opcao)
 
         if opcao == '2':
+            chamar_funcao_banco()
             g_arquivos_estoque()
+            invalidar_catalogo_skus()
             print("✅ Dados do estoque atualizados!")
+            resumo_metricas(desde=inicio_opcao)
 
         elif opcao == '3':
             while True:
@@ -534,20 +2707,11 @@ def main():
 
                 conta_escolhida = input("Digite a conta correspondente: ").strip()
 
-                with sqlite3.connect(BANCO_DE_DADOS) as conn:
-                    # Buscar previsões
-                    df_previsao = pd.read_sql_query("""
-                        SELECT data, quantidade_prevista FROM previsão_futura
-                        WHERE sku = ? AND conta = ?
-                        ORDER BY data
-                    """, conn, params=(sku_escolhido, conta_escolhida))
-
-                    # Buscar vendas reais
-                    df_vendas = pd.read_sql_query("""
-                        SELECT data, quantidade FROM vendas
-                        WHERE sku = ? AND contas = ?
-                        ORDER BY data
-                    """, conn, params=(sku_escolhido, conta_escolhida))
+                # Buscar previsões
+                df_previsao = ler_previsoes(conexao(somente_leitura=True), sku_escolhido, conta_escolhida)[['data', 'quantidade_prevista']]
+
+                # Buscar vendas reais (dias sem venda preenchidos com zero)
+                df_vendas = ler_vendas_densas(sku_escolhido, conta_escolhida)
 
                 if df_previsao.empty:
                     print(f"⚠️ Nenhuma previsão encontrada para SKU '{sku_escolhido}' na conta '{conta_escolhida}'.")
@@ -555,31 +2719,7 @@ def main():
                     print("\n📊 Previsões encontradas:")
                     print(df_previsao[['data', 'quantidade_prevista']])
 
-                    # Prepara os dados
-                    df_previsao['data'] = pd.to_datetime(df_previsao['data'])
-                    df_vendas['data'] = pd.to_datetime(df_vendas['data'])
-
-                    # Plotar o gráfico
-                    plt.figure(figsize=(10, 5))
-                    if not df_vendas.empty:
-                        plt.plot(df_vendas['data'], df_vendas['quantidade'], label='Vendas reais', marker='o', color='blue')
-
-                    plt.plot(df_previsao['data'], df_previsao['quantidade_prevista'],
-                            label='Previsão de vendas', linestyle='--', marker='x', color='orange')
-
-                    plt.title(f"Previsão vs Vendas - SKU: {sku_escolhido} | Conta: {conta_escolhida}")
-                    plt.xlabel("Data")
-                    plt.ylabel("Quantidade")
-                    plt.grid(True)
-                    plt.legend()
-                    # Limitar número de ticks no eixo X
-                    plt.gca().xaxis.set_major_locator(MaxNLocator(nbins=20))
-                    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-                    plt.xticks(rotation=45)
-                    plt.tight_layout()
-                    plt.show()
-
-                conn.close()
+                    mostrar_graficos(grafico_vendas(sku_escolhido, df_vendas, df_previsao, conta_escolhida))
 
         elif opcao == '4':
             while True:
@@ -595,62 +2735,19 @@ def main():
                 if grupo is None:
                     continue
 
-                # Cria datas futuras para o gráfico
-                datas_futuras = pd.date_range(start=grupo['data'].max() + pd.Timedelta(days=1), periods=360)
-
-                # Buscar vendas reais direto do retorno da função
-                df_vendas = grupo[['data', 'quantidade']].copy()
-
-                plt.figure(figsize=(10, 5))
-
-                # Plotar vendas reais
-                if not df_vendas.empty:
-                    plt.plot(df_vendas['data'], df_vendas['quantidade'], label='Vendas reais', marker='o', color='blue')
-
-                # Plotar previsão
-                plt.plot(datas_futuras, vendas_previstas, label='Previsão de vendas', linestyle='--', marker='x', color='orange')
-
-                plt.title(f"Previsão vs Vendas - SKU: {sku_escolhido}")
-                plt.xlabel("Data")
-                plt.ylabel("Quantidade")
-                plt.grid(True)
-                plt.legend()
-
-                # Limitar número de ticks no eixo X
-                plt.gca().xaxis.set_major_locator(MaxNLocator(nbins=20))
-                plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                plt.show()
+                # Vendas reais direto do retorno da função e previsão nos dias seguintes
+                mostrar_graficos(grafico_vendas(sku_escolhido, grupo, serie_prevista(grupo, vendas_previstas)))
 
         elif opcao == '5':
             while True:
-                sku_escolhido = input("Digite o SKU que deseja verificar ou digite 'n' para sair: ").strip()
-                
-                with sqlite3.connect(BANCO_DE_DADOS) as conn:
-                    # Buscar previsões
-                    df_previsao = pd.read_sql_query("""
-                        SELECT sku FROM previsão_futura
-                    """, conn)
-
-                    # Buscar vendas reais
-                    df_vendas = pd.read_sql_query("""
-                        SELECT sku FROM vendas                       
-                    """, conn)
+                sku_escolhido = pedir_sku("Digite o SKU que deseja verificar ou digite 'n' para sair: ")
 
                 if sku_escolhido.lower() == 'n':
                     break
 
                 if sku_escolhido == '':
                     print("SKUS VAZIOS NÃO SÃO ACEITOS, DIGITE UM VALIDO!")
-                elif (
-                    sku_escolhido not in df_vendas['sku'].values
-                    and sku_escolhido not in df_estoque['sku'].values
-                    and sku_escolhido not in df_previsao['sku'].values
-                    ):
-                    print("ESSE SKU NÃO TEM DADOS NECESSÁRIOS PARA UMA BUSCA OU NÃO ESTÁ EM NENHUM DOS BANCOS DE DADOS, TENTE OUTRO!")
-                else:
+                elif conferir_sku(sku_escolhido):
                     # Executa a função e captura os dados de retorno
                     grupo, estoque_previsto, _ = previsao_estoque(sku_escolhido,retornar_dados=True)
 
@@ -658,64 +2755,19 @@ def main():
                     if grupo is None:
                         continue
 
-                    # Cria datas futuras para o gráfico
-                    datas_futuras = pd.date_range(start=grupo['data'].max() + pd.Timedelta(days=1), periods=360)
-
-                    # Buscar vendas reais direto do retorno da função
-                    df_estoque = grupo[['data', 'quantidade_estoque']].copy()
-
-                    plt.figure(figsize=(10, 5))
-
-                    # Plotar vendas reais
-                    if not df_estoque.empty:
-                        plt.plot(df_estoque['data'], df_estoque['quantidade_estoque'], label='Estoque', marker='o', color='blue')
-
-                    # Plotar previsão
-                    plt.plot(datas_futuras, estoque_previsto, label='Previsão de estoque', linestyle='--', marker='x', color='orange')
-
-                    plt.title(f"Previsão vs Estoque - SKU: {sku_escolhido}")
-                    plt.xlabel("Data")
-                    plt.ylabel("Quantidade")
-                    plt.grid(True)
-                    plt.legend()
-
-                    # Limitar número de ticks no eixo X
-                    plt.gca().xaxis.set_major_locator(MaxNLocator(nbins=20))
-                    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-
-                    plt.xticks(rotation=45)
-                    plt.tight_layout()
-                    plt.show()
-                    
-                    conn.close()
+                    # Estoque real direto do retorno da função e projeção nos dias seguintes
+                    mostrar_graficos(grafico_estoque(sku_escolhido, grupo, serie_prevista(grupo, estoque_previsto)))
 
         elif opcao == '6':
             while True:
-                with sqlite3.connect(BANCO_DE_DADOS) as conn:
-                    # Buscar previsões
-                    df_previsao = pd.read_sql_query("""
-                        SELECT sku FROM previsão_futura
-                    """, conn)
-
-                    # Buscar vendas reais
-                    df_vendas = pd.read_sql_query("""
-                        SELECT sku FROM vendas                       
-                    """, conn)
-
-                sku_escolhido = input("Digite o SKU que deseja verificar ou digite 'n' para sair: ").strip()
+                sku_escolhido = pedir_sku("Digite o SKU que deseja verificar ou digite 'n' para sair: ")
 
                 if sku_escolhido.lower() == 'n':
                     break
 
                 if sku_escolhido == '':
                     print("SKUS VAZIOS NÃO SÃO ACEITOS, DIGITE UM VALIDO!")
-                elif (
-                    sku_escolhido not in df_vendas['sku'].values
-                    and sku_escolhido not in df_estoque['sku'].values
-                    and sku_escolhido not in df_previsao['sku'].values
-                    ):
-                    print("ESSE SKU NÃO TEM DADOS NECESSÁRIOS PARA UMA BUSCA OU NÃO ESTÁ EM NENHUM DOS BANCOS DE DADOS, TENTE OUTRO!")
-                else:
+                elif conferir_sku(sku_escolhido):
                     # Executa a função e captura os dados de retorno
                     grupo, vendas_previstas, _ = comparacao_previsao_vendas(sku_escolhido, conta_desejada=None, retornar_dados=True)
 
@@ -723,72 +2775,14 @@ def main():
                     if grupo is None:
                         continue
 
-                    # Cria datas futuras para o gráfico
-                    datas_futuras = pd.date_range(start=grupo['data'].max() + pd.Timedelta(days=1), periods=360)
-
-                    # Buscar vendas reais direto do retorno da função
-                    df_vendas = grupo[['data', 'quantidade']].copy()
-
-                    plt.figure(figsize=(10, 5))
-
-                    # Plotar vendas reais
-                    if not df_vendas.empty:
-                        plt.plot(df_vendas['data'], df_vendas['quantidade'], label='Vendas reais', marker='o', color='blue')
+                    graficos = [grafico_vendas(sku_escolhido, grupo, serie_prevista(grupo, vendas_previstas))]
 
-                    # Plotar previsão
-                    plt.plot(datas_futuras, vendas_previstas, label='Previsão de vendas', linestyle='--', marker='x', color='orange')
+                    # Estoque no mesmo gráfico, abaixo das vendas (se o SKU tiver estoque)
+                    grupo_estoque, estoque_previsto, _ = previsao_estoque(sku_escolhido, retornar_dados=True)
+                    if grupo_estoque is not None:
+                        graficos.append(grafico_estoque(sku_escolhido, grupo_estoque, serie_prevista(grupo_estoque, estoque_previsto)))
 
-                    plt.title(f"Previsão vs Vendas - SKU: {sku_escolhido}")
-                    plt.xlabel("Data")
-                    plt.ylabel("Quantidade")
-                    plt.grid(True)
-                    plt.legend()
-
-                    # Limitar número de ticks no eixo X
-                    plt.gca().xaxis.set_major_locator(MaxNLocator(nbins=20))
-                    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-
-                    plt.xticks(rotation=45)
-                    plt.tight_layout()
-                    
-
-                    # Executa a função e captura os dados de retorno
-                    grupo, estoque_previsto, _ = previsao_estoque(sku_escolhido,retornar_dados=True)
-
-                    # Se a função retornar None, pula para o próximo loop
-                    if grupo is None:
-                        continue
-
-                    # Cria datas futuras para o gráfico
-                    datas_futuras = pd.date_range(start=grupo['data'].max() + pd.Timedelta(days=1), periods=360)
-
-                    # Buscar vendas reais direto do retorno da função
-                    df_estoque = grupo[['data', 'quantidade_estoque']].copy()
-
-                    plt.figure(figsize=(10, 5))
-
-                    # Plotar vendas reais
-                    if not df_estoque.empty:
-                        plt.plot(df_estoque['data'], df_estoque['quantidade_estoque'], label='Estoque', marker='o', color='blue')
-
-                    # Plotar previsão
-                    plt.plot(datas_futuras, estoque_previsto, label='Previsão de estoque', linestyle='--', marker='x', color='orange')
-
-                    plt.title(f"Previsão vs Estoque - SKU: {sku_escolhido}")
-                    plt.xlabel("Data")
-                    plt.ylabel("Quantidade")
-                    plt.grid(True)
-                    plt.legend()
-
-                    # Limitar número de ticks no eixo X
-                    plt.gca().xaxis.set_major_locator(MaxNLocator(nbins=20))
-                    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-
-                    plt.xticks(rotation=45)
-                    plt.tight_layout()
-                    plt.show()
-                    
-                    conn.close()
+                    mostrar_graficos(*graficos)
 
         elif opcao == '7':
             print("Encerrando o programa...")
@@ -797,5 +2791,192 @@ def main():
         else:
             print("⚠️ Opção inválida. Tente novamente.")
 
-main()
+# Comandos da linha de comando (sem interação). Cada um retorna o código de saída do programa
+def comando_ingest_vendas(args):
+    chamar_funcao_banco()
+    skus_alterados = g_arquivos_vendas(incremental=not args.completo, workers=args.workers)
+    if not args.sem_previsao:
+        gerar_todas_previsoes(skus=skus_alterados, workers=args.workers, horizonte=args.horizonte,
+                              materializar=False if args.so_coeficientes else None)
+    print("✅ Dados das vendas atualizados" + ("!" if args.sem_previsao else " e previsões geradas!"))
+    return 0
+
+def comando_ingest_estoque(args):
+    chamar_funcao_banco()
+    g_arquivos_estoque(workers=args.workers, manter_historico=False if args.sem_historico else None)
+    print("✅ Dados do estoque atualizados!")
+    return 0
+
+def comando_forecast(args):
+    chamar_funcao_banco()
+    gerar_todas_previsoes(em_lote=not args.por_sku, workers=args.workers, horizonte=args.horizonte,
+                          materializar=False if args.so_coeficientes else None)
+    print("✅ Previsões geradas!")
+    return 0
+
+def comando_forecast_sku(args):
+    chamar_funcao_banco()
+    grupo, vendas_previstas, _ = comparacao_previsao_vendas(args.sku, args.conta, retornar_dados=True, horizonte=args.horizonte)
+    if grupo is None:
+        return 1
+    print(f"✅ Previsão de {len(vendas_previstas)} dias gerada para o SKU '{args.sku}'.")
+    return 0
+
+def comando_export(args):
+    chamar_funcao_banco()
+    relatorio_ruptura(dias=args.dias, formato=args.formato, horizonte=args.horizonte)
+    return 0
+
+def comando_charts(args):
+    chamar_funcao_banco()
+    renderizar_graficos(skus=args.skus or None, tipos=args.tipos, workers=args.workers)
+    return 0
+
+# Verificações do código; código de saída 1 se alguma falhar
+def comando_verificar(args):
+    chamar_funcao_banco()
+    falhas = verificar_tratar_SKU(n=args.valores, seed=args.seed)
+    sem_indice = verificar_plano_consultas()
+    return 1 if falhas or sem_indice else 0
+
+def comando_gerar_entrada(args):
+    gerar_entrada_sintetica(args.pasta, skus=args.skus, dias=args.dias, linhas_por_arquivo=args.linhas,
+                            arquivos_por_conta=args.arquivos, seed=args.seed)
+    return 0
+
+def comando_benchmark(args):
+    # Guarda contra regressões na inicialização: código 1 se passar do limite ou carregar módulo pesado
+    if args.inicializacao:
+        return 0 if benchmark_inicializacao() else 1
+    if args.memoria:
+        return 0 if benchmark_memoria() else 1
+    if args.escrita:
+        benchmark_escrita()
+        return 0
+    if args.tratar_sku:
+        # Código 1 se a leitura vetorizada não der o mesmo resultado da original
+        return 0 if benchmark_tratar_SKU()[2] else 1
+    if args.previsoes:
+        benchmark_previsoes(lista_workers=[args.workers] if args.workers else None)
+        return 0
+    if args.conexoes:
+        return 0 if benchmark_conexoes(amostra=args.amostra, repeticoes=args.repeticoes) else 1
+    if not args.comparar:
+        escala = {'skus': args.skus, 'dias': args.dias, 'linhas_por_arquivo': args.linhas, 'arquivos_por_conta': args.arquivos}
+        benchmark_pipeline(escala, repeticoes=args.repeticoes, workers=args.workers, amostra=args.amostra, seed=args.seed)
+    comparar_benchmarks()
+    return 0
+
+# Argumentos da linha de comando; sem subcomando o menu interativo é aberto
+def criar_parser_cli():
+    parser_cli = argparse.ArgumentParser(description='Análise das vendas e previsão de estoque.')
+    parser_cli.add_argument('--banco', default=None, help=f"caminho do banco SQLite (padrão: {BANCO_DE_DADOS})")
+    subcomandos = parser_cli.add_subparsers(dest='comando')
+
+    # Opções comuns aos subcomandos
+    comum = argparse.ArgumentParser(add_help=False)
+    comum.add_argument('--workers', type=int, default=None, help='quantidade de processos (padrão: número de núcleos)')
+    comum.add_argument('--horizonte', type=int, default=HORIZONTE_PADRAO, help=f"dias previstos para o futuro (padrão: {HORIZONTE_PADRAO})")
+    comum.add_argument('--perfil', '--profile', action='store_true',
+                       help=f"roda com o cProfile e grava as estatísticas em '{PASTA_SAIDA}/perfil_<subcomando>_<data>.prof'")
+
+    vendas = subcomandos.add_parser('ingest-vendas', parents=[comum], help='atualiza as vendas e gera as previsões (opção 1)')
+    vendas.add_argument('--completo', action='store_true', help='apaga as vendas e relê todos os arquivos do zero, em vez de só os novos/alterados')
+    vendas.add_argument('--sem-previsao', action='store_true', help='não recalcula as previsões')
+    vendas.add_argument('--so-coeficientes', action='store_true', help="grava só os coeficientes, sem as linhas diárias em 'previsão_futura'")
+    vendas.set_defaults(funcao=comando_ingest_vendas)
+
+    estoque = subcomandos.add_parser('ingest-estoque', parents=[comum], help='atualiza o estoque (opção 2)')
+    estoque.add_argument('--sem-historico', action='store_true', help="não guarda a carga em 'estoque_historico'")
+    estoque.set_defaults(funcao=comando_ingest_estoque)
+
+    previsao = subcomandos.add_parser('forecast', parents=[comum], help='recalcula todas as previsões')
+    previsao.add_argument('--por-sku', action='store_true', help='ajusta SKU por SKU em vez do ajuste em lote')
+    previsao.add_argument('--so-coeficientes', action='store_true', help="grava só os coeficientes, sem as linhas diárias em 'previsão_futura'")
+    previsao.set_defaults(funcao=comando_forecast)
+
+    previsao_sku = subcomandos.add_parser('forecast-sku', parents=[comum], help='recalcula a previsão de um SKU')
+    previsao_sku.add_argument('sku')
+    previsao_sku.add_argument('--conta', default=None, help='conta do SKU (padrão: todas as contas somadas)')
+    previsao_sku.set_defaults(funcao=comando_forecast_sku)
+
+    exportar = subcomandos.add_parser('export', parents=[comum], help=f"grava o relatório de ruptura do estoque em '{PASTA_SAIDA}'")
+    exportar.add_argument('--dias', type=int, default=30, help='SKUs que ficam sem estoque em até N dias (padrão: 30)')
+    exportar.add_argument('--formato', choices=['csv', 'parquet'], default='csv')
+    exportar.set_defaults(funcao=comando_export)
+
+    graficos = subcomandos.add_parser('charts', parents=[comum], help=f"grava os gráficos dos SKUs em '{PASTA_SAIDA}', sem abrir janelas")
+    graficos.add_argument('skus', nargs='*', help='SKUs desejados (padrão: o catálogo todo)')
+    graficos.add_argument('--tipos', nargs='+', choices=['vendas', 'estoque'], default=['vendas', 'estoque'])
+    graficos.set_defaults(funcao=comando_charts)
+
+    verificar = subcomandos.add_parser('verificar', help='confere a leitura vetorizada dos SKUs e se as consultas usam índice (código 1 se falhar)')
+    verificar.add_argument('--valores', type=int, default=20000, help='SKUs aleatórios comparados com tratar_SKU (padrão: 20000)')
+    verificar.add_argument('--seed', type=int, default=0, help='semente dos valores (padrão: 0)')
+    verificar.set_defaults(funcao=comando_verificar)
+
+    # Escala dos dados sintéticos
+    escala = argparse.ArgumentParser(add_help=False)
+    escala.add_argument('--skus', type=int, default=ESCALA_BENCHMARK['skus'], help=f"SKUs distintos (padrão: {ESCALA_BENCHMARK['skus']})")
+    escala.add_argument('--dias', type=int, default=ESCALA_BENCHMARK['dias'], help=f"dias de vendas (padrão: {ESCALA_BENCHMARK['dias']})")
+    escala.add_argument('--linhas', type=int, default=ESCALA_BENCHMARK['linhas_por_arquivo'],
+                        help=f"linhas por planilha de vendas (padrão: {ESCALA_BENCHMARK['linhas_por_arquivo']})")
+    escala.add_argument('--arquivos', type=int, default=ESCALA_BENCHMARK['arquivos_por_conta'],
+                        help=f"planilhas de vendas por conta (padrão: {ESCALA_BENCHMARK['arquivos_por_conta']})")
+    escala.add_argument('--seed', type=int, default=0, help='semente dos dados (padrão: 0)')
+
+    gerar = subcomandos.add_parser('gerar-entrada', parents=[escala], help='grava vendas e estoque sintéticos no formato de Entrada/')
+    gerar.add_argument('pasta', help="pasta de destino (ex:. teste/Entrada; não use a Entrada de verdade)")
+    gerar.set_defaults(funcao=comando_gerar_entrada)
+
+    benchmark = subcomandos.add_parser('benchmark', parents=[comum, escala],
+                                       help=f"mede o pipeline sobre dados sintéticos e acrescenta o resultado em '{ARQUIVO_BENCHMARK}'")
+    benchmark.add_argument('--repeticoes', type=int, default=3, help='repetições; vale a mediana (padrão: 3)')
+    benchmark.add_argument('--amostra', type=int, default=20, help='SKUs medidos em previsao_estoque, ou pares com --conexoes (padrão: 20)')
+    benchmark.add_argument('--comparar', action='store_true', help='só mostra os resultados já gravados')
+    benchmark.add_argument('--inicializacao', action='store_true',
+                           help=f"só mede a importação do app.py (código 1 se passar de {LIMITE_INICIALIZACAO_MS} ms ou carregar {', '.join(MODULOS_PREGUICOSOS)})")
+    benchmark.add_argument('--memoria', action='store_true',
+                           help='só mede o pico de memória de cada etapa sobre o banco atual, antes e depois dos tipos compactos')
+    benchmark.add_argument('--escrita', action='store_true',
+                           help='só compara a gravação linha a linha com gravar_em_lote, num banco temporário')
+    benchmark.add_argument('--tratar-sku', action='store_true',
+                           help='só compara tratar_SKU linha a linha com tratar_SKU_coluna (código 1 se os resultados diferirem)')
+    benchmark.add_argument('--previsoes', action='store_true',
+                           help='só mede a previsão SKU por SKU do banco atual com 1 até N processos (regrava as previsões)')
+    benchmark.add_argument('--conexoes', action='store_true',
+                           help='só compara a previsão de um SKU abrindo conexões e com as da sessão, numa cópia do banco atual')
+    benchmark.set_defaults(funcao=comando_benchmark)
+
+    return parser_cli
+
+# Ponto de entrada: 0 = sucesso, 1 = erro, 2 = argumentos inválidos, 130 = interrompido
+def executar_cli(argv=None):
+    args = criar_parser_cli().parse_args(argv)
+    rotacionar_metricas()
+
+    if args.banco:
+        definir_banco(args.banco)
+
+    if args.comando is None:
+        main()
+        return 0
+
+    try:
+        if getattr(args, 'perfil', False):
+            return com_perfil(os.path.join(PASTA_SAIDA, f"perfil_{args.comando}_{datetime.now():%Y%m%d-%H%M%S}.prof"), args.funcao, args)
+        return args.funcao(args)
+    except KeyboardInterrupt:
+        print("Interrompido.", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(f"Erro em '{args.comando}': {e}", file=sys.stderr)
+        return 1
+    finally:
+        # Tempo, linhas e memória de cada etapa (também gravados em ARQUIVO_METRICAS)
+        resumo_metricas()
+
+# Com o processo principal protegido, os processos de leitura podem importar o módulo sem abrir o menu
+if __name__ == '__main__':
+    sys.exit(executar_cli())
 